@@ -0,0 +1,117 @@
+"""
+Formatting throughput for N synthetic sleep timestamps and personal records,
+before (one datetime/pytz call per timestamp and the former per-record
+`if typeId ==` chain of personal-records.py, kept below as the reference)
+and after (formatting.py batches). Outputs are checked to be identical.
+The per-call cost of one night and of one PR, the case of the scheduled
+sync, is measured too.
+
+    python benchmarks/formatting_bench.py --records 100000
+"""
+from datetime import datetime
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pytz  # noqa: E402
+
+import formatting  # noqa: E402
+
+local_tz = pytz.timezone("Europe/Paris")
+
+def per_value_times(timestamps):
+    iso = [datetime.utcfromtimestamp(t / 1000).strftime("%Y-%m-%dT%H:%M:%S.000Z") if t else None for t in timestamps]
+    clock = [datetime.fromtimestamp(t / 1000, local_tz).strftime("%H:%M") if t else "Unknown" for t in timestamps]
+    return iso, clock
+
+def batch_times(timestamps):
+    return formatting.utc_iso(timestamps), formatting.local_clock(timestamps, local_tz)
+
+def legacy_format_value(value, typeId):
+    """
+    format_garmin_value as it was before formatting.py (condensed).
+    """
+    def pace(total_pseconds):
+        return f"{int(total_pseconds // 60)}:{int(total_pseconds % 60):02d} /km"
+
+    if typeId in (1, 2, 3, 4, 5, 6):
+        total_seconds = round(value)
+        hours, minutes, seconds = total_seconds // 3600, (total_seconds % 3600) // 60, total_seconds % 60
+        clock = f"{total_seconds // 60}:{seconds:02d}"
+        if typeId == 1:
+            return f"{clock} /km", f"{clock} /km"
+        if typeId == 2:
+            return clock, pace(total_seconds / 1.60934)
+        if typeId == 3:
+            return clock, pace(total_seconds // 5)
+        if typeId == 4:
+            clock = f"{hours}:{minutes:02d}:{seconds:02d}" if hours > 0 else f"{minutes}:{seconds:02d}"
+            return clock, pace((total_seconds // 10) % 3600)
+        return f"{hours}:{minutes:02d}:{seconds:02d}", pace(total_seconds / (21.0975 if typeId == 5 else 42.195))
+    if typeId in (7, 8):
+        return f"{value / 1000:.2f} km", ""
+    if typeId == 9:
+        return f"{int(value):,} m", ""
+    if typeId == 10:
+        return f"{round(value)} W", ""
+    if typeId in (12, 13, 14):
+        return f"{round(value):,}", ""
+    if typeId == 15:
+        return f"{round(value)} days", ""
+    if int(value // 60) < 60:
+        minutes = int(value // 60)
+        return f"{minutes}:{round((value / 60 - minutes) * 60, 2):05.2f}", ""
+    return f"{int(value // 3600)}:{int((value % 3600) // 60):02}:{round(value % 60, 2):05.2f}", ""
+
+def per_value_records(values, type_ids):
+    pairs = [legacy_format_value(v, t) for v, t in zip(values, type_ids)]
+    return [p[0] for p in pairs], [p[1] for p in pairs]
+
+def batch_records(values, type_ids):
+    return formatting.format_records(values, type_ids)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch formatting of sleep times and PR values")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Bed/wake timestamps over ~10 years, a few missing
+    timestamps = [random.choice([None, random.randint(1.4e12, 1.75e12)]) if random.random() < 0.01
+                  else random.randint(1.4e12, 1.75e12) for _ in range(args.records)]
+    type_ids = [random.choice(list(formatting.RECORD_FORMATS) + [11]) for _ in range(args.records)]
+    values = [random.uniform(150, 20000) for _ in range(args.records)]
+
+    for label, before, after, data in (
+        ("sleep timestamps", per_value_times, batch_times, (timestamps,)),
+        ("PR values", per_value_records, batch_records, (values, type_ids)),
+    ):
+        before_s, expected = timed(before, *data)
+        after_s, result = timed(after, *data)
+        assert result == expected, f"{label}: batch output differs"
+        print(f"{label:<18} {args.records} values: per value {before_s * 1000:8.1f} ms, "
+              f"batch {after_s * 1000:8.1f} ms ({before_s / after_s:.1f}x)")
+
+    night = timestamps[:2]
+    for label, before, after in (
+        ("one night", lambda: per_value_times(night), lambda: batch_times(night)),
+        ("one PR", lambda: legacy_format_value(values[0], type_ids[0]),
+         lambda: formatting.format_record(values[0], type_ids[0])),
+    ):
+        before_us = timeit.timeit(before, number=10000) * 100
+        after_us = timeit.timeit(after, number=10000) * 100
+        print(f"{label:<18} per call: before {before_us:8.1f} us, after {after_us:8.1f} us")
+
+if __name__ == '__main__':
+    main()
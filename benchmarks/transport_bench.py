@@ -0,0 +1,107 @@
+"""
+Per-request latency of sequential Notion databases.query calls against a
+local HTTP stand-in, before (default notion_client.Client, one per script as
+the scripts always did: the baseline) and after (transport.notion_client).
+The default client already reuses its connection, so the difference comes
+only from the timeout/pool settings and the optional h2/brotli support, not
+from saved handshakes. A fresh client per call is shown for reference only.
+
+The stand-in adds --connect-ms on every new connection to mimic the TCP+TLS
+handshake of the real API and gzips responses when the client accepts it.
+
+    python benchmarks/transport_bench.py --requests 200 --connect-ms 40
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from notion_client import Client  # noqa: E402
+
+import transport  # noqa: E402
+
+def fake_query_response(size=100):
+    page = {
+        "object": "page", "id": "0" * 32, "created_time": "2024-01-01T00:00:00.000Z",
+        "properties": {
+            "Date": {"type": "date", "date": {"start": "2024-01-01T10:00:00.000+00:00"}},
+            "Duration (min)": {"type": "number", "number": 30.0},
+            "Distance (km)": {"type": "number", "number": 5.0},
+            "Activity Name": {"type": "title", "title": [{"plain_text": "Run", "text": {"content": "Run"}}]},
+        },
+    }
+    return json.dumps({"object": "list", "results": [page] * size, "has_more": False, "next_cursor": None}).encode()
+
+# Response bytes and connections seen by the stand-in since the last reset
+STATS = {"bytes": 0, "connections": 0}
+
+def make_handler(body, connect_delay):
+    compressed = gzip.compress(body)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            time.sleep(connect_delay)  # stands in for the TLS handshake
+            STATS["connections"] += 1
+            super().setup()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            payload = body
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                payload = compressed
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            STATS["bytes"] += len(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def measure(name, make_client, requests):
+    latencies = []
+    client = None
+    STATS.update(bytes=0, connections=0)
+    for _ in range(requests):
+        client = make_client(client)
+        start = time.perf_counter()
+        client.databases.query(database_id="bench")
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f"{name:<32} mean {statistics.mean(latencies):7.2f} ms   "
+          f"p50 {latencies[len(latencies) // 2]:7.2f} ms   p95 {latencies[int(len(latencies) * 0.95)]:7.2f} ms   "
+          f"{STATS['connections']:4d} connections   {STATS['bytes'] / requests / 1024:6.1f} KiB/response")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--connect-ms", type=float, default=40.0, help="simulated handshake cost per new connection")
+    parser.add_argument("--page-size", type=int, default=100, help="pages per fake query response")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(fake_query_response(args.page_size), args.connect_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{args.requests} sequential databases.query, {args.connect_ms:.0f} ms per new connection")
+    measure("fresh Client per request (ref.)", lambda _: Client(auth="x", base_url=base_url), args.requests)
+    measure("default Client (baseline)", lambda c: c or Client(auth="x", base_url=base_url), args.requests)
+    measure("transport.notion_client", lambda c: c or transport.notion_client("x", base_url=base_url), args.requests)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,22 @@
-from datetime import date, timedelta
-from garminconnect import Garmin
-from notion_client import Client
 from dotenv import load_dotenv
+import argparse
 import os
 
-def get_all_daily_steps(garmin):
+import local_store
+import sync_state
+import tracing
+import transport
+import wellness
+
+@tracing.traced("fetch_steps")
+def get_all_daily_steps(fetcher):
     """
-    Get last x days of daily step count data from Garmin Connect.
+    Get last x days of daily step count data (wellness.STEPS_DAYS_TO_SYNC, excl. today)
+    through the shared wellness fetcher.
     """
-    startdate = date.today() - timedelta(days=1)
-    daterange = [startdate + timedelta(days=x) 
-                 for x in range((date.today() - startdate).days)] # excl. today
     daily_steps = []
-    for d in daterange:
-        daily_steps += garmin.get_daily_steps(d.isoformat(), d.isoformat())
+    for d in wellness.steps_window(fetcher.today):
+        daily_steps += fetcher.day(d, ["steps"]).get("steps") or []
     return daily_steps
 
 def daily_steps_exist(client, database_id, activity_date):
@@ -46,18 +49,30 @@ def steps_need_update(existing_steps, new_steps):
         existing_props['Activity Type']['title'] != activity_type
     )
 
-def update_daily_steps(client, existing_steps, new_steps):
+def steps_values(steps):
     """
-    Update an existing daily steps entry in the Notion database with new data.
+    Normalized daily steps values, as written to Notion (and to the local store).
     """
-    total_distance = new_steps.get('totalDistance')
+    total_distance = steps.get('totalDistance')
     if total_distance is None:
         total_distance = 0
+    return {
+        "date": steps.get('calendarDate'),
+        "total_steps": steps.get('totalSteps'),
+        "step_goal": steps.get('stepGoal'),
+        "total_distance_km": round(total_distance / 1000, 2),
+    }
+
+def update_daily_steps(client, existing_steps, new_steps):
+    """
+    Update an existing daily steps entry in the Notion database with new data.
+    """
+    values = steps_values(new_steps)
     properties = {
         "Activity Type":  {"title": [{"text": {"content": "Walking"}}]},
-        "Total Steps": {"number": new_steps.get('totalSteps')},
-        "Step Goal": {"number": new_steps.get('stepGoal')},
-        "Total Distance (km)": {"number": round(total_distance / 1000, 2)}
+        "Total Steps": {"number": values["total_steps"]},
+        "Step Goal": {"number": values["step_goal"]},
+        "Total Distance (km)": {"number": values["total_distance_km"]}
     }
     
     update = {
@@ -71,15 +86,13 @@ def create_daily_steps(client, database_id, steps):
     """
     Create a new daily steps entry in the Notion database.
     """
-    total_distance = steps.get('totalDistance')
-    if total_distance is None:
-        total_distance = 0
+    values = steps_values(steps)
     properties = {
         "Activity Type": {"title": [{"text": {"content": "Walking"}}]},
-        "Date": {"date": {"start": steps.get('calendarDate')}},
-        "Total Steps": {"number": steps.get('totalSteps')},
-        "Step Goal": {"number": steps.get('stepGoal')},
-        "Total Distance (km)": {"number": round(total_distance / 1000, 2)}
+        "Date": {"date": {"start": values["date"]}},
+        "Total Steps": {"number": values["total_steps"]},
+        "Step Goal": {"number": values["step_goal"]},
+        "Total Distance (km)": {"number": values["total_distance_km"]}
     }
     
     page = {
@@ -89,29 +102,51 @@ def create_daily_steps(client, database_id, steps):
     
     client.pages.create(**page)
 
-def main():
-    load_dotenv()
+@tracing.traced("sync_steps_day")
+def sync_daily_steps(client, database_id, store, steps):
+    """
+    Store one day of steps locally and create/update its Notion entry.
+    """
+    local_store.save_daily_steps(store, steps_values(steps))
+    steps_date = steps.get('calendarDate')
+    existing_steps = daily_steps_exist(client, database_id, steps_date)
+    if existing_steps:
+        if steps_need_update(existing_steps, steps):
+            update_daily_steps(client, existing_steps, steps)
+    else:
+        create_daily_steps(client, database_id, steps)
 
+def run(args):
     # Initialize Garmin and Notion clients using environment variables
     garmin_email = os.getenv("GARMIN_EMAIL")
     garmin_password = os.getenv("GARMIN_PASSWORD")
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_STEPS_DB_ID")
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
+    def login():
+        garmin = transport.garmin_client(garmin_email, garmin_password)
+        garmin.login()
+        return garmin
 
-    daily_steps = get_all_daily_steps(garmin)
+    # Garmin is only logged in if the wellness cache misses some days
+    fetcher = wellness.WellnessFetcher(login)
+    fetcher.prefetch(wellness.sync_plan(fetcher.today, wellness.enabled_metrics()))
+    client = transport.notion_client(notion_token)
+
+    store = sync_state.connect()
+    local_store.init_schema(store)
+
+    daily_steps = get_all_daily_steps(fetcher)
     for steps in daily_steps:
-        steps_date = steps.get('calendarDate')
-        existing_steps = daily_steps_exist(client, database_id, steps_date)
-        if existing_steps:
-            if steps_need_update(existing_steps, steps):
-                update_daily_steps(client, existing_steps, steps)
-        else:
-            create_daily_steps(client, database_id, steps)
+        sync_daily_steps(client, database_id, store, steps)
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Sync daily steps to Notion")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    with tracing.session("daily-steps", args.profile, args.cprofile):
+        run(args)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,153 @@
+from dotenv import load_dotenv
+import argparse
+import os
+import shutil
+
+import formatting
+import local_store
+import pr_engine
+import sync_state
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for exports
+    pa = None
+
+EXPORT_DIR = os.getenv("SYNC_EXPORT_DIR", os.path.join(sync_state.STATE_DIR, "export"))
+
+def schemas():
+    """
+    Arrow schema of each exported dataset (column types stay stable even when
+    a month only holds missing values).
+    """
+    return {
+        "activities": pa.schema([
+            ("activity_id", pa.int64()), ("date", pa.string()),
+            ("activity_type", pa.string()), ("subactivity_type", pa.string()),
+            ("activity_name", pa.string()), ("location", pa.string()),
+            ("distance_km", pa.float64()), ("duration_min", pa.float64()), ("calories", pa.float64()),
+            ("avg_pace", pa.string()), ("avg_power", pa.float64()), ("max_power", pa.float64()),
+            ("training_effect", pa.string()), ("aerobic", pa.float64()), ("aerobic_effect", pa.string()),
+            ("anaerobic", pa.float64()), ("anaerobic_effect", pa.string()),
+            ("pr", pa.bool_()), ("fav", pa.bool_()),
+        ]),
+        "daily_steps": pa.schema([
+            ("date", pa.string()), ("total_steps", pa.int64()), ("step_goal", pa.int64()),
+            ("total_distance_km", pa.float64()),
+        ]),
+        "sleep": pa.schema([
+            ("date", pa.string()), ("sleep_start", pa.string()), ("sleep_end", pa.string()),
+            ("total_sleep_h", pa.float64()), ("light_sleep_h", pa.float64()), ("deep_sleep_h", pa.float64()),
+            ("rem_sleep_h", pa.float64()), ("awake_h", pa.float64()), ("resting_hr", pa.float64()),
+        ]),
+        "personal_records": pa.schema([
+            ("type_id", pa.int64()), ("activity_type", pa.string()), ("date", pa.string()),
+            ("value", pa.float64()), ("formatted_value", pa.string()), ("pace", pa.string()),
+        ]),
+    }
+
+def init_schema(store):
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS export_progress (
+            dataset TEXT PRIMARY KEY,
+            watermark REAL NOT NULL
+        )
+    """)
+
+def dataset_dir(dataset, file_format):
+    """
+    <export dir>/<format>/<dataset>: one root per format, so a dataset
+    directory only ever holds files of a single format.
+    """
+    return os.path.join(EXPORT_DIR, file_format, dataset)
+
+def write_partition(dataset, month, columns, schema, file_format):
+    """
+    (Re)write one month partition: <dataset dir>/month=YYYY-MM/data.<ext>.
+    The file is written next to the target and renamed, so readers never see
+    a partial file.
+    """
+    extension = "parquet" if file_format == "parquet" else "arrow"
+    path = os.path.join(dataset_dir(dataset, file_format), f"month={month}", f"data.{extension}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {}
+    for field in schema:
+        values = columns[field.name]
+        if pa.types.is_boolean(field.type):
+            # SQLite stores booleans as 0/1
+            values = [None if v is None else bool(v) for v in values]
+        arrays[field.name] = values
+    table = pa.table(arrays, schema=schema)
+    tmp_path = path + ".tmp"
+    if file_format == "parquet":
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return table.num_rows
+
+def export_store_table(store, dataset, schema, file_format, full=False):
+    """
+    Rewrite only the months holding rows changed since the previous export.
+    """
+    # Progress is tracked per format, so switching format rewrites every month
+    progress_key = f"{dataset}:{file_format}"
+    row = store.execute("SELECT watermark FROM export_progress WHERE dataset = ?", (progress_key,)).fetchone()
+    # Nothing on disk (first export, directory removed...): write every month
+    full = full or not os.path.isdir(dataset_dir(dataset, file_format))
+    since = None if full or not row else row[0]
+    watermark = store.execute(f"SELECT MAX(updated_at) FROM {dataset}").fetchone()[0]
+    months = local_store.changed_months(store, dataset, since)
+    rows = 0
+    for month in months:
+        rows += write_partition(dataset, month, local_store.load_month(store, dataset, month), schema, file_format)
+    if watermark is not None:
+        store.execute(
+            "INSERT OR REPLACE INTO export_progress (dataset, watermark) VALUES (?, ?)", (progress_key, watermark)
+        )
+    print(f"Exported {dataset}: {len(months)} month(s), {rows} row(s)")
+
+def export_personal_records(store, schema, file_format):
+    """
+    The PR timeline is small: the dataset is rewritten on each export. A
+    rebuild can drop events, so the previous months are removed first.
+    """
+    pr_engine.init_schema(store)
+    rows = store.execute("SELECT type_id, activity_type, date, value FROM pr_events ORDER BY date, type_id").fetchall()
+    values, paces = formatting.format_records([r[3] for r in rows], [r[0] for r in rows])
+    rows = [row + formatted for row, formatted in zip(rows, zip(values, paces))]
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[2][:7], []).append(row)
+    shutil.rmtree(dataset_dir("personal_records", file_format), ignore_errors=True)
+    for month, month_rows in by_month.items():
+        columns = {field.name: [r[i] for r in month_rows] for i, field in enumerate(schema)}
+        write_partition("personal_records", month, columns, schema, file_format)
+    print(f"Exported personal_records: {len(by_month)} month(s), {len(rows)} row(s)")
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Export the synced data to Parquet/Arrow files partitioned by month")
+    parser.add_argument("--format", choices=("parquet", "arrow"), default=os.getenv("SYNC_EXPORT_FORMAT", "parquet"),
+                        help="parquet (compressed) or arrow (IPC files, memory-mappable)")
+    parser.add_argument("--full", action="store_true", help="rewrite every month instead of the changed ones")
+    args = parser.parse_args()
+
+    if pa is None:
+        print("pyarrow is not installed, skipping export (pip install pyarrow)")
+        return
+
+    store = sync_state.connect()
+    local_store.init_schema(store)
+    init_schema(store)
+
+    dataset_schemas = schemas()
+    for dataset in ("activities", "daily_steps", "sleep"):
+        export_store_table(store, dataset, dataset_schemas[dataset], args.format, args.full)
+    export_personal_records(store, dataset_schemas["personal_records"], args.format)
+
+if __name__ == '__main__':
+    main()
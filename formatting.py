@@ -0,0 +1,197 @@
+from bisect import bisect_right
+from datetime import datetime
+import functools
+import math
+import time
+
+import numpy as np
+
+# Batch formatting of timestamps, durations and personal-record values.
+# Every function takes a whole list (one night or years of backfill) and does
+# the arithmetic in one numpy pass; only the final string assembly is per item.
+# Short lists (a single night, Garmin's dozen PRs) take the per-value path
+# instead, where numpy's setup would cost more than it saves. Both paths share
+# the string assembly and give the same output as the per-record code they
+# replace. Thresholds measured with benchmarks/formatting_bench.py.
+
+BATCH_MIN = 16
+# Records are grouped by typeId first, which only pays off on long lists
+RECORD_BATCH_MIN = 1024
+EPOCH = datetime(1970, 1, 1)
+
+def _epoch_ms(timestamps_ms):
+    """
+    int64 epoch-ms array and a mask of the present (non-empty, non-zero) ones.
+    """
+    ms = np.array([t or 0 for t in timestamps_ms], dtype=np.int64)
+    return ms, ms != 0
+
+def utc_iso(timestamps_ms):
+    """
+    Epoch-ms timestamps as '%Y-%m-%dT%H:%M:%S.000Z' UTC strings (None if missing).
+    """
+    if len(timestamps_ms) < BATCH_MIN:
+        return [time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(t // 1000)) if t else None for t in timestamps_ms]
+    ms, present = _epoch_ms(timestamps_ms)
+    text = np.datetime_as_string(ms.astype("datetime64[ms]"), unit="s")
+    return [f"{t}.000Z" if p else None for t, p in zip(text.tolist(), present.tolist())]
+
+@functools.lru_cache(maxsize=None)
+def _transition_lists(tz):
+    """
+    UTC transition instants (epoch seconds) and the UTC offset in force from
+    each one, read once per timezone from pytz's tables.
+    """
+    times = getattr(tz, "_utc_transition_times", None)
+    if not times:  # fixed-offset zone (UTC, StaticTzInfo...)
+        offset = EPOCH.replace(tzinfo=tz).utcoffset()
+        return [np.iinfo(np.int64).min], [int(offset.total_seconds())]
+    # exact integer seconds (the first transition is datetime.min)
+    starts = [(t - EPOCH).days * 86400 + (t - EPOCH).seconds for t in times]
+    offsets = [int(info[0].total_seconds()) for info in tz._transition_info]
+    return starts, offsets
+
+@functools.lru_cache(maxsize=None)
+def _transitions(tz):
+    starts, offsets = _transition_lists(tz)
+    return np.array(starts, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+def _clock_hm(minute_of_day):
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+def local_clock(timestamps_ms, tz, missing="Unknown"):
+    """
+    Epoch-ms timestamps as local 'HH:MM' in tz (`missing` if empty).
+    """
+    if len(timestamps_ms) < BATCH_MIN:
+        starts, offsets = _transition_lists(tz)
+        text = []
+        for t in timestamps_ms:
+            if not t:
+                text.append(missing)
+                continue
+            seconds = t // 1000
+            offset = offsets[max(bisect_right(starts, seconds) - 1, 0)]
+            text.append(_clock_hm(int((seconds + offset) // 60 % 1440)))
+        return text
+    ms, present = _epoch_ms(timestamps_ms)
+    seconds = ms // 1000
+    starts, offsets = _transitions(tz)
+    index = np.maximum(np.searchsorted(starts, seconds, side="right") - 1, 0)
+    minute_of_day = ((seconds + offsets[index]) // 60) % 1440
+    return [_clock_hm(m) if p else missing for m, p in zip(minute_of_day.tolist(), present.tolist())]
+
+def hours_minutes(seconds):
+    """
+    Durations in seconds as 'Xh Ym' (empty counts as 0).
+    """
+    if len(seconds) < BATCH_MIN:
+        minutes = [(s or 0) // 60 for s in seconds]
+    else:
+        minutes = (np.array([s or 0 for s in seconds], dtype=np.int64) // 60).tolist()
+    return [f"{m // 60}h {m % 60}m" for m in minutes]
+
+# Personal records: one table of formats per Garmin typeId.
+#   ("pace",)                         the value is the pace per km, as m:ss /km
+#   ("race", km, hours, wrap_pace)    finishing time (hours: "never", "auto" or
+#                                     "always") and pace over `km`
+#   ("distance",)                     meters shown in km
+#   ("count", template, rounding)     integer count ("trunc" or "round")
+# Unlisted typeIds are shown as an elapsed time with hundredths.
+
+RECORD_FORMATS = {
+    1: ("pace",),                              # 1K
+    2: ("race", 1.60934, "never", False),      # 1mi
+    3: ("race", 5, "never", False),            # 5K
+    4: ("race", 10, "auto", True),             # 10K (its pace always dropped whole hours)
+    5: ("race", 21.0975, "always", False),     # Half Marathon
+    6: ("race", 42.195, "always", False),      # Marathon
+    7: ("distance",),                          # Longest Run
+    8: ("distance",),                          # Longest Ride
+    9: ("count", "{:,} m", "trunc"),           # Total Ascent
+    10: ("count", "{} W", "round"),            # Max Avg Power
+    12: ("count", "{:,}", "round"),            # Most Steps in a Day
+    13: ("count", "{:,}", "round"),            # Most Steps in a Week
+    14: ("count", "{:,}", "round"),            # Most Steps in a Month
+    15: ("count", "{} days", "round"),         # Longest Goal Streak
+}
+ELAPSED = ("elapsed",)
+
+def _clock_text(h, m, s, hours):
+    if hours == "always" or (hours == "auto" and h > 0):
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{h * 60 + m if hours == 'never' else m}:{s:02d}"
+
+def _elapsed_text(value):
+    # round(x, 2) stays in Python to match the historical output exactly
+    if int(value // 60) < 60:
+        minutes = int(value // 60)
+        return f"{minutes}:{round((value / 60 - minutes) * 60, 2):05.2f}"
+    return f"{int(value // 3600)}:{int((value % 3600) // 60):02}:{round(value % 60, 2):05.2f}"
+
+def _format_one(spec, value):
+    kind = spec[0]
+    value = float(value)
+    if kind in ("pace", "race"):
+        seconds = round(value)
+        h, rest = divmod(seconds, 3600)
+        m, s = divmod(rest, 60)
+        if kind == "pace":
+            text = f"{_clock_text(h, m, s, 'never')} /km"
+            return text, text
+        _, distance_km, hours, wrap_pace = spec
+        pace_minutes, pace_seconds = divmod(math.floor(seconds / distance_km), 60)
+        if wrap_pace:
+            pace_minutes %= 60
+        return _clock_text(h, m, s, hours), f"{pace_minutes}:{pace_seconds:02d} /km"
+    if kind == "distance":
+        return f"{value / 1000:.2f} km", ""
+    if kind == "count":
+        return spec[1].format(int(value) if spec[2] == "trunc" else round(value)), ""
+    return _elapsed_text(value), ""
+
+def _format_batch(spec, values):
+    kind = spec[0]
+    no_pace = [""] * len(values)
+    if kind in ("pace", "race"):
+        seconds = np.rint(values).astype(np.int64)
+        h, rest = np.divmod(seconds, 3600)
+        m, s = np.divmod(rest, 60)
+        hours = "never" if kind == "pace" else spec[2]
+        text = [_clock_text(*hms, hours) for hms in zip(h.tolist(), m.tolist(), s.tolist())]
+        if kind == "pace":
+            text = [f"{t} /km" for t in text]
+            return text, text
+        _, distance_km, _, wrap_pace = spec
+        pace_minutes, pace_seconds = np.divmod(np.floor(seconds / distance_km).astype(np.int64), 60)
+        if wrap_pace:
+            pace_minutes %= 60
+        return text, [f"{pm}:{ps:02d} /km" for pm, ps in zip(pace_minutes.tolist(), pace_seconds.tolist())]
+    if kind == "distance":
+        return [f"{v:.2f} km" for v in (values / 1000).tolist()], no_pace
+    if kind == "count":
+        rounded = (np.trunc(values) if spec[2] == "trunc" else np.rint(values)).astype(np.int64)
+        return [spec[1].format(v) for v in rounded.tolist()], no_pace
+    return [_elapsed_text(v) for v in values.tolist()], no_pace
+
+def format_records(values, type_ids):
+    """
+    Format raw PR values, grouped by typeId: ([value text], [pace text]).
+    """
+    if len(values) < RECORD_BATCH_MIN:
+        pairs = [format_record(value, type_id) for value, type_id in zip(values, type_ids)]
+        return [p[0] for p in pairs], [p[1] for p in pairs]
+    values = np.asarray(values, dtype=np.float64)
+    type_ids = np.asarray(type_ids, dtype=np.int64)
+    formatted = [None] * len(values)
+    paces = [None] * len(values)
+    for type_id in np.unique(type_ids).tolist():
+        index = np.flatnonzero(type_ids == type_id)
+        group_values, group_paces = _format_batch(RECORD_FORMATS.get(type_id, ELAPSED), values[index])
+        for i, value, pace in zip(index.tolist(), group_values, group_paces):
+            formatted[i] = value
+            paces[i] = pace
+    return formatted, paces
+
+def format_record(value, type_id):
+    return _format_one(RECORD_FORMATS.get(type_id, ELAPSED), value)
@@ -1,13 +1,25 @@
-from datetime import datetime, timezone
-from garminconnect import Garmin
-from notion_client import Client
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
+from itertools import islice
+import argparse
+import multiprocessing
 import pytz
 import os
 
+import local_store
+import sync_journal
+import sync_shards
+import sync_state
+import tracing
+import transport
+
 # Your local time zone
 local_tz = pytz.timezone('Europe/Paris')
 
+# Nombre max de groupes ouverts comparés à chaque page lors du dédoublonnage
+DUPLICATE_WINDOW = 50
+
 ACTIVITY_MAPPING = {
     "marche à pied": ("Walking", "Marche à pied"),
     "course à pied": ("Running", "Running"),
@@ -50,6 +62,7 @@ ACTIVITY_ICONS = {
     "Yoga": "https://img.icons8.com/?size=100&id=9783&format=png&color=000000",
 }
 
+@tracing.traced("fetch_activities")
 def get_all_activities(garmin, limit=1000):
     return garmin.get_activities(0, limit)
 
@@ -109,8 +122,11 @@ def split_activity_name(activity_name):
     else:
         return parts[-1], " ".join(parts[:-1])
 
-def create_activity(client, database_id, activity):
-    activity_date = activity.get('startTimeGMT')
+def activity_values(activity):
+    """
+    Valeurs normalisées d'une activité Garmin, telles qu'écrites dans Notion
+    (et gardées dans le store local).
+    """
     raw_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
     activity_name, location = split_activity_name(raw_name)
 
@@ -119,30 +135,64 @@ def create_activity(client, database_id, activity):
         activity_name
     )
 
-    icon_url = ACTIVITY_ICONS.get(activity_subtype if activity_subtype != activity_type else activity_type)
-
-    properties = {
-        "Date": {"date": {"start": activity_date}},
-        "Activity Type": {"select": {"name": activity_type}},
-        "Subactivity Type": {"select": {"name": activity_subtype}},
-        "Activity Name": {"title": [{"text": {"content": activity_name}}]},
-        "Distance (km)": {"number": round(activity.get('distance', 0) / 1000, 2)},
-        "Duration (min)": {"number": round(activity.get('duration', 0) / 60, 2)},
-        "Calories": {"number": round(activity.get('calories', 0))},
-        "Avg Pace": {"rich_text": [{"text": {"content": format_pace(activity.get('averageSpeed', 0))}}]},
-        "Avg Power": {"number": round(activity.get('avgPower', 0), 1)},
-        "Max Power": {"number": round(activity.get('maxPower', 0), 1)},
-        "Training Effect": {"select": {"name": format_training_effect(activity.get('trainingEffectLabel', 'Unknown'))}},
-        "Aerobic": {"number": round(activity.get('aerobicTrainingEffect', 0), 1)},
-        "Aerobic Effect": {"select": {"name": format_training_message(activity.get('aerobicTrainingEffectMessage', 'Unknown'))}},
-        "Anaerobic": {"number": round(activity.get('anaerobicTrainingEffect', 0), 1)},
-        "Anaerobic Effect": {"select": {"name": format_training_message(activity.get('anaerobicTrainingEffectMessage', 'Unknown'))}},
-        "PR": {"checkbox": activity.get('pr', False)},
-        "Fav": {"checkbox": activity.get('favorite', False)}
+    return {
+        "activity_id": activity.get('activityId'),
+        "date": activity.get('startTimeGMT'),
+        "activity_type": activity_type,
+        "subactivity_type": activity_subtype,
+        "activity_name": activity_name,
+        "location": location,
+        "distance_km": round(activity.get('distance', 0) / 1000, 2),
+        "duration_min": round(activity.get('duration', 0) / 60, 2),
+        "calories": round(activity.get('calories', 0)),
+        "avg_pace": format_pace(activity.get('averageSpeed', 0)),
+        "avg_power": round(activity.get('avgPower', 0), 1),
+        "max_power": round(activity.get('maxPower', 0), 1),
+        "training_effect": format_training_effect(activity.get('trainingEffectLabel', 'Unknown')),
+        "aerobic": round(activity.get('aerobicTrainingEffect', 0), 1),
+        "aerobic_effect": format_training_message(activity.get('aerobicTrainingEffectMessage', 'Unknown')),
+        "anaerobic": round(activity.get('anaerobicTrainingEffect', 0), 1),
+        "anaerobic_effect": format_training_message(activity.get('anaerobicTrainingEffectMessage', 'Unknown')),
+        "pr": activity.get('pr', False),
+        "fav": activity.get('favorite', False),
     }
 
-    if location:
-        properties["Location"] = {"rich_text": [{"text": {"content": location}}]}
+def activity_properties(values):
+    """
+    Propriétés Notion communes à la création et à la mise à jour (sans Date ni Location).
+    """
+    return {
+        "Activity Type": {"select": {"name": values["activity_type"]}},
+        "Subactivity Type": {"select": {"name": values["subactivity_type"]}},
+        "Activity Name": {"title": [{"text": {"content": values["activity_name"]}}]},
+        "Distance (km)": {"number": values["distance_km"]},
+        "Duration (min)": {"number": values["duration_min"]},
+        "Calories": {"number": values["calories"]},
+        "Avg Pace": {"rich_text": [{"text": {"content": values["avg_pace"]}}]},
+        "Avg Power": {"number": values["avg_power"]},
+        "Max Power": {"number": values["max_power"]},
+        "Training Effect": {"select": {"name": values["training_effect"]}},
+        "Aerobic": {"number": values["aerobic"]},
+        "Aerobic Effect": {"select": {"name": values["aerobic_effect"]}},
+        "Anaerobic": {"number": values["anaerobic"]},
+        "Anaerobic Effect": {"select": {"name": values["anaerobic_effect"]}},
+        "PR": {"checkbox": values["pr"]},
+        "Fav": {"checkbox": values["fav"]}
+    }
+
+def activity_icon(values):
+    activity_type, activity_subtype = values["activity_type"], values["subactivity_type"]
+    return ACTIVITY_ICONS.get(activity_subtype if activity_subtype != activity_type else activity_type)
+
+def create_activity(client, database_id, activity):
+    values = activity_values(activity)
+    icon_url = activity_icon(values)
+
+    properties = activity_properties(values)
+    properties["Date"] = {"date": {"start": values["date"]}}
+
+    if values["location"]:
+        properties["Location"] = {"rich_text": [{"text": {"content": values["location"]}}]}
 
     page = {
         "parent": {"database_id": database_id},
@@ -152,45 +202,21 @@ def create_activity(client, database_id, activity):
     if icon_url:
         page["icon"] = {"type": "external", "external": {"url": icon_url}}
 
-    client.pages.create(**page)
-
-def update_activity(client, existing_activity, new_activity):
-    raw_name = format_entertainment(new_activity.get('activityName', 'Unnamed Activity'))
-    activity_name, location = split_activity_name(raw_name)
+    return client.pages.create(**page)
 
-    activity_type, activity_subtype = format_activity_type(
-        new_activity.get('activityType', {}).get('typeKey', 'Unknown'),
-        activity_name
-    )
+def update_activity(client, existing_record, new_activity):
+    values = activity_values(new_activity)
+    icon_url = activity_icon(values)
 
-    icon_url = ACTIVITY_ICONS.get(activity_subtype if activity_subtype != activity_type else activity_type)
-
-    properties = {
-        "Activity Type": {"select": {"name": activity_type}},
-        "Subactivity Type": {"select": {"name": activity_subtype}},
-        "Activity Name": {"title": [{"text": {"content": activity_name}}]},
-        "Distance (km)": {"number": round(new_activity.get('distance', 0) / 1000, 2)},
-        "Duration (min)": {"number": round(new_activity.get('duration', 0) / 60, 2)},
-        "Calories": {"number": round(new_activity.get('calories', 0))},
-        "Avg Pace": {"rich_text": [{"text": {"content": format_pace(new_activity.get('averageSpeed', 0))}}]},
-        "Avg Power": {"number": round(new_activity.get('avgPower', 0), 1)},
-        "Max Power": {"number": round(new_activity.get('maxPower', 0), 1)},
-        "Training Effect": {"select": {"name": format_training_effect(new_activity.get('trainingEffectLabel', 'Unknown'))}},
-        "Aerobic": {"number": round(new_activity.get('aerobicTrainingEffect', 0), 1)},
-        "Aerobic Effect": {"select": {"name": format_training_message(new_activity.get('aerobicTrainingEffectMessage', 'Unknown'))}},
-        "Anaerobic": {"number": round(new_activity.get('anaerobicTrainingEffect', 0), 1)},
-        "Anaerobic Effect": {"select": {"name": format_training_message(new_activity.get('anaerobicTrainingEffectMessage', 'Unknown'))}},
-        "PR": {"checkbox": new_activity.get('pr', False)},
-        "Fav": {"checkbox": new_activity.get('favorite', False)}
-    }
+    properties = activity_properties(values)
 
-    if location:
-        properties["Location"] = {"rich_text": [{"text": {"content": location}}]}
+    if values["location"]:
+        properties["Location"] = {"rich_text": [{"text": {"content": values["location"]}}]}
     else:
         properties["Location"] = {"rich_text": []}
 
     update = {
-        "page_id": existing_activity['id'],
+        "page_id": existing_record.id,
         "properties": properties,
     }
 
@@ -199,66 +225,114 @@ def update_activity(client, existing_activity, new_activity):
 
     client.pages.update(**update)
 
-def activity_exists(client, database_id, activity):
+class ActivityRecord:
     """
-    Recherche dans Notion si une activité existe déjà.
-    Logique : on récupère toutes les pages pour la même Date, puis on compare
-    Duration et Distance avec une petite tolérance. Si duration/distance manquent,
-    on fallback sur le nom.
+    Version compacte d'une page Notion de la base Activities.
+    Seules les valeurs utiles à la réconciliation sont gardées, le JSON brut
+    (métadonnées des propriétés, utilisateurs, URLs) est jeté dès le parsing.
     """
-    target_date = activity.get('startTimeGMT', '').split('T')[0]
-    target_duration = round(activity.get('duration', 0) / 60, 2)
-    target_distance = round(activity.get('distance', 0) / 1000, 2)
-    target_name = format_entertainment(activity.get('activityName', '')).strip().lower()
+    __slots__ = ('id', 'date', 'duration', 'distance', 'calories', 'name', 'garmin_id', 'created_time', 'filled')
+
+    def __init__(self, id, date, duration, distance, calories, name, garmin_id=None, created_time=None, filled=0):
+        self.id = id
+        self.date = date
+        self.duration = duration
+        self.distance = distance
+        self.calories = calories
+        self.name = name
+        self.garmin_id = garmin_id
+        self.created_time = created_time
+        self.filled = filled
+
+    def __repr__(self):
+        return f"ActivityRecord({self.id!r}, {self.date!r}, {self.name!r})"
+
+def count_filled_properties(props):
+    """
+    Nombre de propriétés non vides d'une page (sert à choisir la page à garder).
+    """
+    filled = 0
+    for prop in props.values():
+        value = prop.get(prop.get('type'))
+        if value not in (None, "", [], {}, False):
+            filled += 1
+    return filled
+
+def parse_activity_page(page):
+    """
+    Transforme une page Notion (résultat de databases.query) en ActivityRecord.
+    """
+    props = page.get('properties', {})
+    title_arr = props.get('Activity Name', {}).get('title') or []
+    garmin_id = props.get('Garmin ID', {}).get('number')
+    return ActivityRecord(
+        page['id'],
+        (props.get('Date', {}).get('date') or {}).get('start'),
+        props.get('Duration (min)', {}).get('number'),
+        props.get('Distance (km)', {}).get('number'),
+        props.get('Calories', {}).get('number'),
+        (title_arr[0].get('plain_text', '') if title_arr else '').strip(),
+        None if garmin_id is None else int(garmin_id),
+        page.get('created_time'),
+        count_filled_properties(props),
+    )
 
+def query_activity_records(client, database_id, **query):
+    """
+    Parcourt databases.query (pagination) et renvoie des ActivityRecord au fil de l'eau :
+    chaque lot de 100 pages est parsé puis libéré avant la requête suivante.
+    """
     start_cursor = None
     while True:
         if start_cursor:
-            res = client.databases.query(database_id=database_id, filter={
-                "property": "Date",
-                "date": {"equals": target_date}
-            }, start_cursor=start_cursor)
+            res = client.databases.query(database_id=database_id, start_cursor=start_cursor, page_size=100, **query)
         else:
-            res = client.databases.query(database_id=database_id, filter={
-                "property": "Date",
-                "date": {"equals": target_date}
-            })
-
+            res = client.databases.query(database_id=database_id, page_size=100, **query)
         for page in res.get('results', []):
-            props = page.get('properties', {})
-            dur = props.get('Duration (min)', {}).get('number')
-            dist = props.get('Distance (km)', {}).get('number')
-
-            # Si on a dur+dist: comparaison avec tolérance (pour arrondis)
-            if dur is not None and dist is not None:
-                if abs(round(dur, 2) - target_duration) <= 0.02 and abs(round(dist, 2) - target_distance) <= 0.02:
-                    return page
-
-            # Sinon fallback sur le nom (si présent)
-            title_arr = props.get('Activity Name', {}).get('title') or []
-            page_name = (title_arr[0].get('plain_text', '') if title_arr else '').strip().lower()
-            if target_name and page_name and target_name == page_name:
-                return page
-
+            yield parse_activity_page(page)
         if not res.get('has_more'):
             break
         start_cursor = res.get('next_cursor')
 
-    return None
-def activity_needs_update(existing_page, new_activity, tolerance=0.01):
+def match_activity(records, activity):
     """
-    Compare une activité existante dans Notion (page) avec une activité Garmin.
-    Retourne True si une mise à jour est nécessaire.
+    Cherche parmi des ActivityRecord celui qui correspond à une activité Garmin.
+    On compare Duration et Distance avec une petite tolérance. Si duration/distance
+    manquent, on fallback sur le nom.
     """
+    target_duration = round(activity.get('duration', 0) / 60, 2)
+    target_distance = round(activity.get('distance', 0) / 1000, 2)
+    target_name = format_entertainment(activity.get('activityName', '')).strip().lower()
+
+    for record in records:
+        # Si on a dur+dist: comparaison avec tolérance (pour arrondis)
+        if record.duration is not None and record.distance is not None:
+            if abs(round(record.duration, 2) - target_duration) <= 0.02 and abs(round(record.distance, 2) - target_distance) <= 0.02:
+                return record
+
+        # Sinon fallback sur le nom (si présent)
+        page_name = record.name.lower()
+        if target_name and page_name and target_name == page_name:
+            return record
+
+    return None
 
-    props = existing_page.get("properties", {})
+@tracing.traced("lookup_activity")
+def activity_exists(client, database_id, activity):
+    """
+    Recherche dans Notion si une activité existe déjà.
+    Logique : on récupère toutes les pages pour la même Date, puis match_activity.
+    Retourne l'ActivityRecord correspondant ou None.
+    """
+    target_date = activity.get('startTimeGMT', '').split('T')[0]
+    date_filter = {"property": "Date", "date": {"equals": target_date}}
+    return match_activity(query_activity_records(client, database_id, filter=date_filter), activity)
 
-    # Extraire valeurs Notion
-    notion_distance = props.get("Distance (km)", {}).get("number")
-    notion_duration = props.get("Duration (min)", {}).get("number")
-    notion_calories = props.get("Calories", {}).get("number")
-    notion_name_arr = props.get("Activity Name", {}).get("title") or []
-    notion_name = (notion_name_arr[0].get("plain_text", "") if notion_name_arr else "").strip()
+def activity_needs_update(existing_record, new_activity, tolerance=0.01):
+    """
+    Compare une activité existante dans Notion (ActivityRecord) avec une activité Garmin.
+    Retourne True si une mise à jour est nécessaire.
+    """
 
     # Valeurs Garmin (normalisées comme dans tes fonctions create/update)
     garmin_distance = round(new_activity.get("distance", 0) / 1000, 2)
@@ -267,101 +341,430 @@ def activity_needs_update(existing_page, new_activity, tolerance=0.01):
     garmin_name = format_entertainment(new_activity.get("activityName", "Unnamed Activity")).strip()
 
     # Comparaisons numériques avec tolérance
-    if notion_distance is not None and abs(notion_distance - garmin_distance) > tolerance:
+    if existing_record.distance is not None and abs(existing_record.distance - garmin_distance) > tolerance:
         return True
-    if notion_duration is not None and abs(notion_duration - garmin_duration) > tolerance:
+    if existing_record.duration is not None and abs(existing_record.duration - garmin_duration) > tolerance:
         return True
-    if notion_calories is not None and abs(notion_calories - garmin_calories) > 1:  # ±1 kcal
+    if existing_record.calories is not None and abs(existing_record.calories - garmin_calories) > 1:  # ±1 kcal
         return True
 
     # Comparaison du nom
-    if notion_name.lower() != garmin_name.lower():
+    if existing_record.name.lower() != garmin_name.lower():
         return True
 
     # Si aucune différence détectée
     return False
 
-def remove_duplicates(client, database_id, archive_only=True):
+def find_duplicate_groups(records, tolerance=0.02):
+    """
+    Regroupe les ActivityRecord en doublon sans comparaison deux à deux.
+    Les records sont triés par (date/heure, durée, distance) puis balayés : chaque
+    page est comparée à l'ancre (premier record) des groupes ouverts de la même
+    date, et rejoint le premier dont la durée ET la distance diffèrent d'au plus
+    `tolerance` (même règle que activity_exists, sans transitivité). Au plus
+    DUPLICATE_WINDOW ancres sont comparées par page.
+    Sans durée/distance, on retombe sur l'égalité du nom.
+    Retourne une liste de groupes (listes de records), chacun d'au moins 2 records.
+    """
+    measured = []
+    by_name = {}
+    for record in records:
+        if record.duration is not None and record.distance is not None:
+            measured.append((record.date or "", round(record.duration, 2), round(record.distance, 2), record))
+        else:
+            by_name.setdefault((record.date, record.name.lower()), []).append(record)
+
+    measured.sort(key=lambda item: item[:3])
+    groups = []
+    anchors = deque()  # (date, durée, distance, index du groupe), par durée croissante
+    for date, dur, dist, record in measured:
+        # Fermer les groupes d'une autre date ou dont l'ancre est hors tolérance
+        while anchors and (anchors[0][0] != date or dur - anchors[0][1] > tolerance + 1e-9):
+            anchors.popleft()
+        for _, _, anchor_dist, g in islice(reversed(anchors), DUPLICATE_WINDOW):
+            if abs(dist - anchor_dist) <= tolerance + 1e-9:
+                groups[g].append(record)
+                break
+        else:
+            anchors.append((date, dur, dist, len(groups)))
+            groups.append([record])
+
+    groups.extend(by_name.values())
+    return [group for group in groups if len(group) > 1]
+
+def choose_page_to_keep(group, keep="oldest"):
+    """
+    Choix déterministe de la page à conserver dans un groupe de doublons.
+    keep="oldest"      -> la plus ancienne (created_time), puis la plus remplie
+    keep="most_filled" -> la plus remplie, puis la plus ancienne
+    L'id Notion départage toujours les ex aequo.
     """
-    Parcourt toute la base (pagination), construit des clés (date, durée, distance, nom)
-    et archive toutes les pages qui apparaissent en doublon (garde la première).
+    if keep == "most_filled":
+        return min(group, key=lambda r: (-r.filled, r.created_time or "", r.id))
+    return min(group, key=lambda r: (r.created_time or "", -r.filled, r.id))
+
+def print_duplicate_report(plan):
+    """
+    Affiche le rapport des doublons avant archivage.
+    """
+    if not plan:
+        print("No duplicates found")
+        return
+    total = sum(len(dups) for _, dups in plan)
+    print(f"Found {total} duplicate page(s) in {len(plan)} group(s):")
+    for kept, dups in plan:
+        print(f"  {kept.date} | {kept.name or '-'} | {kept.duration} min | {kept.distance} km")
+        print(f"    keep:    {kept.id}")
+        for dup in dups:
+            print(f"    archive: {dup.id}")
+
+def plan_duplicate_removal(records, tolerance=0.02, keep="oldest"):
+    """
+    Retourne [(record gardé, [records à archiver]), ...] trié par date.
+    """
+    plan = []
+    for group in find_duplicate_groups(records, tolerance):
+        kept = choose_page_to_keep(group, keep)
+        plan.append((kept, sorted((r for r in group if r is not kept), key=lambda r: r.id)))
+    plan.sort(key=lambda item: (item[0].date or "", item[0].id))
+    return plan
+
+@tracing.traced("dedupe")
+def remove_duplicates(client, database_id, archive_only=True, tolerance=0.02, keep="oldest"):
+    """
+    Parcourt toute la base (pagination), détecte les doublons avec la même tolérance
+    que activity_exists (voir find_duplicate_groups), affiche un rapport puis archive
+    toutes les pages en doublon sauf celle choisie par choose_page_to_keep.
     archive_only=True -> archive (safe). False -> on tente la même chose mais Notion ne propose
     pas de suppression définitive via API publique : on archive quand même.
     """
-    # Récupérer toutes les pages (pagination)
-    pages = []
-    start_cursor = None
-    while True:
-        if start_cursor:
-            res = client.databases.query(database_id=database_id, start_cursor=start_cursor, page_size=100)
+    # Récupérer toutes les pages (pagination), en records compacts
+    records = list(query_activity_records(client, database_id))
+
+    plan = plan_duplicate_removal(records, tolerance, keep)
+    print_duplicate_report(plan)
+
+    # Archive duplicates (Notion API: archived=True)
+    for _, dups in plan:
+        for dup in dups:
+            try:
+                client.pages.update(page_id=dup.id, archived=True)
+                print(f"Archived duplicate: {dup.id}")
+            except Exception as e:
+                print(f"Failed to archive {dup.id}: {e}")
+
+def activity_fingerprint(activity):
+    """
+    Empreinte des valeurs comparées par activity_needs_update : si elle n'a pas
+    changé depuis la dernière synchro, inutile d'interroger Notion.
+    """
+    return "|".join((
+        f"{round(activity.get('distance', 0) / 1000, 2):.2f}",
+        f"{round(activity.get('duration', 0) / 60, 2):.2f}",
+        str(round(activity.get('calories', 0))),
+        format_entertainment(activity.get('activityName', 'Unnamed Activity')).strip().lower(),
+    ))
+
+def sync_activity(client, database_id, activity, existing, journal=None):
+    """
+    Crée ou met à jour une activité selon l'ActivityRecord existant (ou None).
+    Avec un journal (connexion sync_state), l'intention est écrite avant l'appel
+    Notion puis marquée faite après : un crash entre les deux est rejoué au
+    prochain démarrage par recover_journal au lieu de créer un doublon.
+    Retourne ("created" | "updated" | "skipped", record).
+    """
+    raw_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
+    activity_id = activity.get('activityId')
+    if activity_id is None:
+        journal = None
+
+    if existing:
+        if activity_needs_update(existing, activity):
+            if journal:
+                sync_journal.begin(journal, activity_id, "update", activity, existing.id)
+            update_activity(client, existing, activity)
+            outcome = "updated"
+            print(f"Updated: {raw_name}")
         else:
-            res = client.databases.query(database_id=database_id, page_size=100)
-        pages.extend(res.get('results', []))
-        if not res.get('has_more'):
-            break
-        start_cursor = res.get('next_cursor')
+            outcome = "skipped"
+            print(f"Skipped (exists): {raw_name}")
+        record = existing
+    else:
+        if journal:
+            sync_journal.begin(journal, activity_id, "create", activity)
+        record = parse_activity_page(create_activity(client, database_id, activity))
+        outcome = "created"
+        print(f"Created: {raw_name}")
 
-    seen = {}
-    duplicates = []
+    if journal:
+        sync_journal.commit(journal, activity_id, record.id, activity_fingerprint(activity))
+    return outcome, record
 
-    for page in pages:
-        props = page.get('properties', {})
-        date = props.get('Date', {}).get('date', {}).get('start')
-        dur = props.get('Duration (min)', {}).get('number')
-        dist = props.get('Distance (km)', {}).get('number')
-        title_arr = props.get('Activity Name', {}).get('title') or []
-        name = (title_arr[0].get('plain_text', '') if title_arr else '').strip().lower()
+def find_journaled_activity(client, database_id, activity, journal):
+    """
+    Cherche la page d'une activité déjà synchronisée grâce au journal.
+    Retourne (record ou None, inchangée) : si l'empreinte n'a pas bougé, aucune
+    requête Notion n'est faite ; sinon la page connue est relue par son id.
+    Sans entrée exploitable, on retombe sur activity_exists.
+    """
+    entry = sync_journal.lookup(journal, activity.get('activityId'))
+    if entry and entry[0] == "done" and entry[1]:
+        status, page_id, fingerprint = entry
+        if fingerprint == activity_fingerprint(activity):
+            return None, True
+        try:
+            page = client.pages.retrieve(page_id=page_id)
+            if not page.get('archived'):
+                return parse_activity_page(page), False
+        except Exception as e:
+            print(f"Journaled page {page_id} not readable, searching by date: {e}")
+    return activity_exists(client, database_id, activity), False
 
-        key = (date, None if dur is None else round(dur, 2), None if dist is None else round(dist, 2), name)
+@tracing.traced("recover_journal")
+def recover_journal(client, database_id, journal):
+    """
+    Au démarrage : résout les écritures restées 'pending' après un crash.
+    - create : si la page existe déjà dans Notion on l'associe, sinon on la recrée ;
+    - update : on rejoue la mise à jour (idempotente) sur la page connue.
+    """
+    for activity_id, op, page_id, activity in sync_journal.pending(journal):
+        try:
+            if op == "update" and page_id:
+                existing = parse_activity_page(client.pages.retrieve(page_id=page_id))
+            else:
+                existing = activity_exists(client, database_id, activity)
+            if existing:
+                update_activity(client, existing, activity)
+                sync_journal.commit(journal, activity_id, existing.id, activity_fingerprint(activity))
+                print(f"Recovered pending {op}: {activity_id} -> {existing.id}")
+            else:
+                sync_activity(client, database_id, activity, None, journal)
+                print(f"Replayed pending {op}: {activity_id}")
+        except Exception as e:
+            print(f"Failed to recover pending {op} for {activity_id}: {e}")
 
-        if key in seen:
-            duplicates.append(page['id'])
-        else:
-            seen[key] = page['id']
+@tracing.traced("sync_activity")
+def sync_garmin_activity(client, database_id, journal, activity):
+    """
+    Synchro d'une activité Garmin : store local, puis création/mise à jour Notion
+    sauf si le journal indique qu'elle n'a pas changé.
+    """
+    local_store.save_activity(journal, activity_values(activity))
+    existing, unchanged = find_journaled_activity(client, database_id, activity, journal)
+    if unchanged:
+        print(f"Skipped (unchanged): {format_entertainment(activity.get('activityName', 'Unnamed Activity'))}")
+        return "skipped"
+    outcome, _ = sync_activity(client, database_id, activity, existing, journal)
+    return outcome
+
+def check_lease(renew):
+    """
+    Prolonge le bail (un UPDATE SQLite) ; lève une erreur s'il a été repris.
+    """
+    if renew and not renew():
+        raise RuntimeError("lease lost")
 
-    # Archive duplicates (Notion API: archived=True)
-    for dup_id in duplicates:
+@tracing.traced("sync_shard")
+def sync_shard(garmin, client, database_id, start, end, renew=None, journal=None):
+    """
+    Réconcilie uniquement les activités d'un shard [start, end] (dates locales Garmin).
+    Les pages Notion sont lues une seule fois pour tout le shard (fenêtre élargie
+    d'un jour de chaque côté car Notion stocke la date GMT), puis le matching se
+    fait en mémoire. Les doublons dont la date est dans le shard sont archivés.
+    `renew` est appelé juste avant chaque écriture Notion pour prolonger le bail ;
+    s'il renvoie False un autre worker a repris le shard et on s'arrête sans écrire.
+    """
+    counts = {"created": 0, "updated": 0, "skipped": 0, "archived": 0}
+    date_filter = {"and": [
+        {"property": "Date", "date": {"on_or_after": (start - timedelta(days=1)).isoformat()}},
+        {"property": "Date", "date": {"on_or_before": (end + timedelta(days=1)).isoformat()}},
+    ]}
+    records = list(query_activity_records(client, database_id, filter=date_filter))
+
+    own_records = [r for r in records if r.date and start.isoformat() <= r.date[:10] <= end.isoformat()]
+    archived_ids = set()
+    for _, dups in plan_duplicate_removal(own_records):
+        for dup in dups:
+            check_lease(renew)
+            try:
+                client.pages.update(page_id=dup.id, archived=True)
+                archived_ids.add(dup.id)
+                print(f"Archived duplicate: {dup.id}")
+            except Exception as e:
+                print(f"Failed to archive {dup.id}: {e}")
+    counts["archived"] = len(archived_ids)
+
+    records_by_day = {}
+    for record in records:
+        if record.date and record.id not in archived_ids:
+            records_by_day.setdefault(record.date[:10], []).append(record)
+
+    activities = garmin.get_activities_by_date(start.isoformat(), end.isoformat())
+    for activity in activities:
+        if journal:
+            local_store.save_activity(journal, activity_values(activity))
+        day = activity.get('startTimeGMT', '')[:10]
+        existing = match_activity(records_by_day.get(day, []), activity)
+        check_lease(renew)
+        outcome, record = sync_activity(client, database_id, activity, existing, journal)
+        if outcome == "created":
+            records_by_day.setdefault(day, []).append(record)
+        counts[outcome] += 1
+    return counts
+
+def login_garmin(tokenstore=None):
+    """
+    Connexion Garmin. Les workers réutilisent les jetons du processus parent
+    (garth dumps) pour éviter une connexion complète par worker.
+    """
+    garmin = transport.garmin_client(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
+    if tokenstore:
         try:
-            client.pages.update(page_id=dup_id, archived=True)
-            print(f"Archived duplicate: {dup_id}")
+            garmin.login(tokenstore)
+            return garmin
         except Exception as e:
-            print(f"Failed to archive {dup_id}: {e}")
+            print(f"Token login failed, using credentials: {e}")
+    garmin.login()
+    return garmin
 
-def main():
+def run_worker(run_id, worker_name, shard_index, shard_count, tokenstore=None):
+    """
+    Boucle d'un worker : réclame un shard, le réconcilie, recommence.
+    """
     load_dotenv()
+    database_id = os.getenv("NOTION_DB_ID")
+    garmin = login_garmin(tokenstore)
+    client = transport.notion_client(os.getenv("NOTION_TOKEN"))
+    conn = sync_state.connect()
+
+    with tracing.child_session(worker_name):
+        while True:
+            shard = sync_shards.claim_shard(conn, run_id, worker_name, shard_index, shard_count)
+            if shard is None:
+                break
+            shard_id, start, end = shard
+            print(f"[{worker_name}] Syncing shard {shard_id}")
+            try:
+                counts = sync_shard(
+                    garmin, client, database_id, start, end,
+                    renew=lambda: sync_shards.renew_lease(conn, run_id, shard_id, worker_name),
+                    journal=conn
+                )
+            except Exception as e:
+                print(f"[{worker_name}] Shard {shard_id} failed: {e}")
+                sync_shards.fail_shard(conn, run_id, shard_id, worker_name, e)
+                continue
+            sync_shards.complete_shard(conn, run_id, shard_id, worker_name, **counts)
+    conn.close()
+
+def print_run_totals(run_id):
+    conn = sync_state.connect()
+    totals = sync_shards.run_totals(conn, run_id)
+    conn.close()
+    shards = ", ".join(f"{count} {status}" for status, count in sorted(totals["shards"].items()))
+    print(f"Run {run_id}: {shards or 'no shards'}")
+    print(f"  created={totals['created']} updated={totals['updated']} skipped={totals['skipped']} archived={totals['archived']}")
+    for shard_id, error in totals["errors"]:
+        print(f"  {shard_id}: {error}")
+
+def run_partitioned(args):
+    """
+    Mode partitionné : la plage [since, until] est découpée en shards mensuels
+    enregistrés dans la table de baux SQLite, puis traités par `workers` processus.
+    Pour des jobs CI séparés, --shard-index/--shard-count répartit les shards
+    de façon statique (aucun état partagé nécessaire).
+    """
+    until = args.until or date.today()
+    run_id = args.run_id or f"backfill-{args.since.isoformat()}-{until.isoformat()}"
+
+    conn = sync_state.connect()
+    sync_journal.init_schema(conn)
+    local_store.init_schema(conn)
+    sync_shards.register_shards(conn, run_id, sync_shards.month_shards(args.since, until))
+    conn.close()
+
+    tokenstore = login_garmin().garth.dumps() if args.workers > 1 else None
+    if args.workers > 1:
+        processes = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(run_id, f"worker-{args.shard_index}-{n}", args.shard_index, args.shard_count, tokenstore)
+            )
+            for n in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        run_worker(run_id, f"worker-{args.shard_index}-0", args.shard_index, args.shard_count)
+
+    print_run_totals(run_id)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync Garmin activities to Notion")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="split the date range into monthly shards processed by leased workers")
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to sync in partitioned mode (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="last day to sync in partitioned mode (default: today)")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes in partitioned mode")
+    parser.add_argument("--shard-index", type=int, default=int(os.getenv("SYNC_SHARD_INDEX", "0")),
+                        help="index of this job when shards are split across CI jobs")
+    parser.add_argument("--shard-count", type=int, default=int(os.getenv("SYNC_SHARD_COUNT", "1")),
+                        help="number of CI jobs sharing the shards")
+    parser.add_argument("--run-id", help="partitioned run to create or resume (default derived from the date range)")
+    parser.add_argument("--report", action="store_true", help="only print the merged totals of --run-id")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="scan the whole database for duplicates (done automatically on the first journaled run)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    if args.report and not args.run_id:
+        parser.error("--report requires --run-id")
+    if args.partitioned and not args.since:
+        parser.error("--partitioned requires --since")
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    return args
+
+def run(args):
+    if args.report:
+        print_run_totals(args.run_id)
+        return
+    if args.partitioned:
+        run_partitioned(args)
+        return
 
     garmin_email = os.getenv("GARMIN_EMAIL")
     garmin_password = os.getenv("GARMIN_PASSWORD")
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_DB_ID")
 
-    garmin = Garmin(garmin_email, garmin_password)
+    garmin = transport.garmin_client(garmin_email, garmin_password)
     garmin.login()
-    client = Client(auth=notion_token)
+    client = transport.notion_client(notion_token)
+
+    journal = sync_state.connect()
+    sync_journal.init_schema(journal)
+    local_store.init_schema(journal)
 
-    # 1) Nettoyer les doublons existants (archive)
-    remove_duplicates(client, database_id, archive_only=True)
+    # 1) Rejouer les écritures interrompues par un crash
+    recover_journal(client, database_id, journal)
 
-    # 2) Importer / mettre à jour
+    # 2) Nettoyer les doublons existants (archive). Avec le journal, le scan
+    #    complet n'est nécessaire qu'au premier passage ou sur demande.
+    if args.dedupe or sync_journal.is_empty(journal):
+        remove_duplicates(client, database_id, archive_only=True)
+
+    # 3) Importer / mettre à jour
     activities = get_all_activities(garmin)
     for activity in activities:
-        activity_date = activity.get('startTimeGMT')
-        raw_name = format_entertainment(activity.get('activityName', 'Unnamed Activity'))
-        activity_type, activity_subtype = format_activity_type(
-            activity.get('activityType', {}).get('typeKey', 'Unknown'),
-            raw_name
-        )
-
-        existing = activity_exists(client, database_id, activity)
-        if existing:
-            if activity_needs_update(existing, activity):
-                update_activity(client, existing, activity)
-                print(f"Updated: {raw_name}")
-            else:
-                print(f"Skipped (exists): {raw_name}")
-        else:
-            create_activity(client, database_id, activity)
-            print(f"Created: {raw_name}")
+        sync_garmin_activity(client, database_id, journal, activity)
+
+def main():
+    load_dotenv()
+    args = parse_args()
+    with tracing.session("garmin-activities", args.profile, args.cprofile):
+        run(args)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,94 @@
+import time
+
+# Local copy of the normalized values written to Notion, so summaries, records
+# and exports can be computed without paging through the Notion databases.
+# Table -> (primary key, columns). Values come from activity_values,
+# steps_values and sleep_values in the sync scripts.
+TABLES = {
+    "activities": ("activity_id", (
+        "activity_id", "date", "activity_type", "subactivity_type", "activity_name", "location",
+        "distance_km", "duration_min", "calories", "avg_pace", "avg_power", "max_power",
+        "training_effect", "aerobic", "aerobic_effect", "anaerobic", "anaerobic_effect", "pr", "fav",
+    )),
+    "daily_steps": ("date", (
+        "date", "total_steps", "step_goal", "total_distance_km",
+    )),
+    "sleep": ("date", (
+        "date", "sleep_start", "sleep_end", "total_sleep_h", "light_sleep_h", "deep_sleep_h",
+        "rem_sleep_h", "awake_h", "resting_hr",
+    )),
+}
+
+def init_schema(conn):
+    for table, (key, columns) in TABLES.items():
+        column_defs = ", ".join(f"{column} PRIMARY KEY" if column == key else column for column in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_defs}, updated_at REAL NOT NULL)")
+
+def save(conn, table, values):
+    """
+    Upsert one row. updated_at only moves when a value actually changed, which
+    lets downstream stages (summaries, exports) process changed rows only.
+    Returns True if the row was inserted or changed.
+    """
+    key, columns = TABLES[table]
+    if values.get(key) is None:
+        return False
+    placeholders = ", ".join("?" for _ in columns)
+    assignments = ", ".join(f"{column} = excluded.{column}" for column in columns if column != key)
+    changed = " OR ".join(f"{table}.{column} IS NOT excluded.{column}" for column in columns if column != key)
+    cur = conn.execute(
+        f"""
+        INSERT INTO {table} ({", ".join(columns)}, updated_at) VALUES ({placeholders}, ?)
+        ON CONFLICT ({key}) DO UPDATE SET {assignments}, updated_at = excluded.updated_at
+        WHERE {changed}
+        """,
+        [values.get(column) for column in columns] + [time.time()]
+    )
+    return cur.rowcount == 1
+
+def save_activity(conn, values):
+    return save(conn, "activities", values)
+
+def save_daily_steps(conn, values):
+    return save(conn, "daily_steps", values)
+
+def save_sleep(conn, values):
+    return save(conn, "sleep", values)
+
+def load_columns(conn, table, columns=None, since=None):
+    """
+    Load a table column-wise: {column: [values...]}, ordered by primary key.
+    `since` (a time.time() value) restricts to rows changed after it.
+    """
+    key, all_columns = TABLES[table]
+    columns = list(columns or all_columns)
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    params = ()
+    if since is not None:
+        query += " WHERE updated_at > ?"
+        params = (since,)
+    rows = conn.execute(query + f" ORDER BY {key}", params).fetchall()
+    return {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+
+def changed_months(conn, table, since=None):
+    """
+    Months ('YYYY-MM') holding rows changed after `since` (all months if None).
+    """
+    query = f"SELECT DISTINCT substr(date, 1, 7) FROM {table} WHERE date IS NOT NULL"
+    params = ()
+    if since is not None:
+        query += " AND updated_at > ?"
+        params = (since,)
+    return sorted(row[0] for row in conn.execute(query, params))
+
+def load_month(conn, table, month, columns=None):
+    """
+    Column-wise rows of one month ('YYYY-MM'), ordered by date.
+    """
+    key, all_columns = TABLES[table]
+    columns = list(columns or all_columns)
+    rows = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {table} WHERE substr(date, 1, 7) = ? ORDER BY date, {key}",
+        (month,)
+    ).fetchall()
+    return {column: [row[i] for row in rows] for i, column in enumerate(columns)}
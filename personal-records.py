@@ -1,8 +1,18 @@
 from datetime import date, datetime
-from garminconnect import Garmin
-from notion_client import Client
+from dotenv import load_dotenv
+import argparse
 import os
 
+import formatting
+import pr_engine
+import sync_state
+import tracing
+import transport
+
+# Derived best efforts are estimated from a run's average pace: they get their
+# own records ("5K (est.)") so they never archive Garmin's split-based PRs
+ESTIMATED_SUFFIX = " (est.)"
+
 def get_icon_for_record(activity_name):
     icon_map = {
         "1K": "🥇",
@@ -21,7 +31,7 @@ def get_icon_for_record(activity_name):
         "Longest Goal Streak": "✔️",
         "Other": "🏅"
     }
-    return icon_map.get(activity_name, "🏅")
+    return icon_map.get(activity_name.removesuffix(ESTIMATED_SUFFIX), "🏅")
 
 
 def get_cover_for_record(activity_name):
@@ -38,7 +48,7 @@ def get_cover_for_record(activity_name):
         "Most Steps in a Month": "https://images.unsplash.com/photo-1580058572462-98e2c0e0e2f0?ixlib=rb-4.0.3&q=85&fm=jpg&crop=entropy&cs=srgb&w=4800",
         "Longest Goal Streak": "https://images.unsplash.com/photo-1477332552946-cfb384aeaf1c?ixlib=rb-4.0.3&q=85&fm=jpg&crop=entropy&cs=srgb&w=4800"
     }
-    return cover_map.get(activity_name, "https://images.unsplash.com/photo-1471506480208-91b3a4cc78be?ixlib=rb-4.0.3&q=85&fm=jpg&crop=entropy&cs=srgb&w=4800") 
+    return cover_map.get(activity_name.removesuffix(ESTIMATED_SUFFIX), "https://images.unsplash.com/photo-1471506480208-91b3a4cc78be?ixlib=rb-4.0.3&q=85&fm=jpg&crop=entropy&cs=srgb&w=4800") 
 
 def format_activity_type(activity_type):
     if activity_type is None:
@@ -51,125 +61,10 @@ def format_activity_name(activity_name):
     return activity_name
 
 def format_garmin_value(value, activity_type, typeId):
-    if typeId  == 1:  # 1K
-        total_seconds = round(value)  # Round to the nearest second
-        minutes = total_seconds // 60
-        seconds = total_seconds % 60
-        formatted_value = f"{minutes}:{seconds:02d} /km"
-        pace = formatted_value  # For these types, the value is the pace
-        return formatted_value, pace
-
-    if typeId  == 2:  # 1mile
-        total_seconds = round(value)  # Round to the nearest second
-        minutes = total_seconds // 60
-        seconds = total_seconds % 60
-        formatted_value = f"{minutes}:{seconds:02d}"
-        total_pseconds = total_seconds / 1.60934  # Divide by 1.60934 to get pace per km
-        pminutes = int(total_pseconds // 60)      # Convert to integer
-        pseconds = int(total_pseconds % 60)       # Convert to integer
-        formatted_pace = f"{pminutes}:{pseconds:02d} /km"
-        return formatted_value, formatted_pace
-
-    if typeId == 3:  # 5K
-        total_seconds = round(value) 
-        minutes = total_seconds // 60
-        seconds = total_seconds % 60
-        formatted_value = f"{minutes}:{seconds:02d}"
-        total_pseconds = total_seconds // 5  # Divide by 5km
-        pminutes = total_pseconds // 60
-        pseconds = total_pseconds % 60
-        formatted_pace = f"{pminutes}:{pseconds:02d} /km"
-        return formatted_value, formatted_pace
-
-    if typeId == 4:  # 10K
-        # Round to the nearest second
-        total_seconds = round(value)
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        if hours > 0:
-            formatted_value = f"{hours}:{minutes:02d}:{seconds:02d}"
-        else:
-            formatted_value = f"{minutes}:{seconds:02d}"
-        total_pseconds = total_seconds // 10  # Divide by 10km
-        phours = total_pseconds // 3600
-        pminutes = (total_pseconds % 3600) // 60
-        pseconds = total_pseconds % 60
-        formatted_pace = f"{pminutes}:{pseconds:02d} /km"
-        return formatted_value, formatted_pace
-
-    if typeId == 5:  # Half Marathon   ✅ bien aligné
-        total_seconds = round(value)
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        formatted_value = f"{hours}:{minutes:02d}:{seconds:02d}"
-        
-        # Pace basé sur 21.1 km
-        total_pseconds = total_seconds / 21.0975
-        pminutes = int(total_pseconds // 60)
-        pseconds = int(total_pseconds % 60)
-        formatted_pace = f"{pminutes}:{pseconds:02d} /km"
-        return formatted_value, formatted_pace
-
-    if typeId == 6:  # Marathon
-        total_seconds = round(value)
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        formatted_value = f"{hours}:{minutes:02d}:{seconds:02d}"
-        
-        # Pace basé sur 42.195 km
-        total_pseconds = total_seconds / 42.195
-        pminutes = int(total_pseconds // 60)
-        pseconds = int(total_pseconds % 60)
-        formatted_pace = f"{pminutes}:{pseconds:02d} /km"
-        return formatted_value, formatted_pace
-
-
-    if typeId in [7, 8]:  # Longest Run, Longest Ride
-        value_km = value / 1000
-        formatted_value = f"{value_km:.2f} km"
-        pace = ""  # No pace for these types
-        return formatted_value, pace
-
-    if typeId == 9:  # Total Ascent
-        value_m = int(value)
-        formatted_value = f"{value_m:,} m"
-        pace = ""
-        return formatted_value, pace
-
-    if typeId == 10:  # Max Avg Power
-        value_w = round(value)
-        formatted_value = f"{value_w} W"
-        pace = ""
-        return formatted_value, pace
-
-    if typeId in [12, 13, 14]:  # Step counts
-        value_steps = round(value)
-        formatted_value = f"{value_steps:,}"
-        pace = ""
-        return formatted_value, pace
-
-    if typeId == 15:  # Longest Goal Streak
-        value_days = round(value)
-        formatted_value = f"{value_days} days"
-        pace = ""
-        return formatted_value, pace
-
-    # Default case
-    if int(value // 60) < 60:  # If total time is less than an hour
-        minutes = int(value // 60)
-        seconds = round((value / 60 - minutes) * 60, 2)
-        formatted_value = f"{minutes}:{seconds:05.2f}"
-    else:  # If total time is one hour or more
-        hours = int(value // 3600)
-        minutes = int((value % 3600) // 60)
-        seconds = round(value % 60, 2)
-        formatted_value = f"{hours}:{minutes:02}:{seconds:05.2f}"
-    
-    pace = ""
-    return formatted_value, pace
+    """
+    (value, pace) texts of a record, from the per-typeId table in formatting.py.
+    """
+    return formatting.format_record(value, typeId)
 
 def replace_activity_name_by_typeId(typeId):
     typeId_name_map = {
@@ -190,6 +85,26 @@ def replace_activity_name_by_typeId(typeId):
     }
     return typeId_name_map.get(typeId, "Unnamed Activity")
 
+def record_name(typeId, estimated=False):
+    activity_name = replace_activity_name_by_typeId(typeId)
+    return activity_name + ESTIMATED_SUFFIX if estimated else activity_name
+
+def retract_record(client, database_id, typeId, activity_date, estimated=False):
+    """
+    Archive the Notion page of a timeline entry that is no longer a record.
+    Returns True if it is gone (or was never written).
+    """
+    page = get_record_by_date_and_name(client, database_id, activity_date, record_name(typeId, estimated))
+    if not page:
+        return True
+    try:
+        client.pages.update(page_id=page['id'], archived=True)
+        print(f"Archived dropped record: {record_name(typeId, estimated)} ({activity_date})")
+        return True
+    except Exception as e:
+        print(f"Error archiving record: {e}")
+        return False
+
 def get_existing_record(client, database_id, activity_name):
     query = client.databases.query(
         database_id=database_id,
@@ -215,6 +130,9 @@ def get_record_by_date_and_name(client, database_id, activity_date, activity_nam
     return query['results'][0] if query['results'] else None
 
 def update_record(client, page_id, activity_date, value, pace, activity_name, is_pr=True):
+    """
+    Returns True once Notion accepted the update.
+    """
     properties = {
         "Date": {"date": {"start": activity_date}},
         "PR": {"checkbox": is_pr}
@@ -236,17 +154,21 @@ def update_record(client, page_id, activity_date, value, pace, activity_name, is
             icon={"emoji": icon},
             cover={"type": "external", "external": {"url": cover}}
         )
-        
+        return True
     except Exception as e:
         print(f"Error updating record: {e}")
+        return False
 
-def write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace):
+def write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, is_pr=True):
+    """
+    Returns True once Notion created the page.
+    """
     properties = {
         "Date": {"date": {"start": activity_date}},
         "Activity Type": {"select": {"name": activity_type}},
         "Record": {"title": [{"text": {"content": activity_name}}]},
         "typeId": {"number": typeId},
-        "PR": {"checkbox": True}
+        "PR": {"checkbox": is_pr}
     }
     
     if value:
@@ -265,63 +187,136 @@ def write_new_record(client, database_id, activity_date, activity_type, activity
             icon={"emoji": icon},
             cover={"type": "external", "external": {"url": cover}}
         )
+        return True
     except Exception as e:
         print(f"Error writing new record: {e}")
+        return False
+
+@tracing.traced("sync_record")
+def sync_record(client, database_id, activity_date, activity_type, typeId, raw_value, formatted=None, estimated=False, current=False):
+    """
+    Write one personal record to Notion: update the entry of the same date,
+    archive the current PR and create the new one if it is more recent, or add
+    an older record as a past (PR unchecked) timeline entry.
+    `formatted` is the (value, pace) pair when already batch-formatted;
+    `estimated` records are kept apart under "<name> (est.)"; a `current`
+    record gets the PR flag even if it is older than the PR in Notion.
+    Returns True if Notion accepted the writes.
+    """
+    activity_name = record_name(typeId, estimated)
+    value, pace = formatted or format_garmin_value(raw_value, activity_type, typeId)
+
+    existing_pr_record = get_existing_record(client, database_id, activity_name)
+    existing_date_record = get_record_by_date_and_name(client, database_id, activity_date, activity_name)
+    existing_date = None
+    if existing_pr_record:
+        date_prop = (existing_pr_record.get('properties') or {}).get('Date') or {}
+        existing_date = (date_prop.get('date') or {}).get('start')
+
+    if existing_date_record:
+        # Only the most recent record keeps the PR flag
+        is_pr = current or not (existing_date and existing_date > activity_date)
+        written = update_record(client, existing_date_record['id'], activity_date, value, pace, activity_name, is_pr)
+        if current and existing_pr_record and existing_pr_record['id'] != existing_date_record['id']:
+            written = update_record(client, existing_pr_record['id'], existing_date, None, None, activity_name, False) and written
+        print(f"Updated existing record: {activity_type} - {activity_name}")
+    elif existing_pr_record:
+        # Add error handling here
+        try:
+            if existing_date:
+                if activity_date > existing_date or current:
+                    archived = update_record(client, existing_pr_record['id'], existing_date, None, None, activity_name, False)
+                    print(f"Archived old record: {activity_type} - {activity_name}")
+
+                    written = write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
+                    written = written and archived
+                    print(f"Created new PR record: {activity_type} - {activity_name}")
+                else:
+                    written = write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace, False)
+                    print(f"Added past record: {activity_type} - {activity_name} ({activity_date})")
+            else:
+                # Handle case where date is missing or improperly formatted
+                print(f"Warning: Record {activity_name} has invalid date format - updating anyway")
+                written = update_record(client, existing_pr_record['id'], activity_date, value, pace, activity_name, True)
+        except (KeyError, TypeError) as e:
+            print(f"Error processing record {activity_name}: {e}")
+            print(f"Record data: {existing_pr_record['properties']}")
+            # Fallback - create new record if we can't process the existing one properly
+            written = write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
+    else:
+        written = write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
+        print(f"Successfully written new record: {activity_type} - {activity_name}")
+    return written
+
+@tracing.traced("derive_records")
+def sync_derived_records(client, database_id):
+    """
+    Derive records from the local store (pr_engine) and publish the new
+    timeline entries in chronological order, so each PR archives the previous one.
+    Entries Notion did not accept stay unpublished and are retried next run.
+    """
+    store = sync_state.connect()
+    new_events = pr_engine.update_records(store)
+    print(f"{new_events} new personal record(s) derived from local history")
+    # Entries a backfill rebuild dropped from the timeline go first
+    for typeId, activity_type, activity_date, value in pr_engine.retracted_events(store):
+        if retract_record(client, database_id, typeId, activity_date, typeId in pr_engine.BEST_EFFORTS):
+            pr_engine.forget_retracted(store, typeId, activity_date)
+    best = pr_engine.current_best(store)
+    events = pr_engine.unpublished_events(store)
+    values, paces = formatting.format_records([e[4] for e in events], [e[1] for e in events])
+    for (event_id, typeId, activity_type, activity_date, value), formatted in zip(events, zip(values, paces)):
+        estimated = typeId in pr_engine.BEST_EFFORTS
+        current = best.get(typeId) == activity_date
+        if sync_record(client, database_id, activity_date, activity_type, typeId, value, formatted, estimated, current):
+            pr_engine.mark_published(store, event_id)
+        else:
+            print(f"Record {typeId} of {activity_date} not written, will retry on the next run")
 
-def main():
+@tracing.traced("sync_garmin_records")
+def sync_garmin_records(client, database_id, garmin):
+    """
+    Write the current personal records reported by Garmin.
+    """
+    records = garmin.get_personal_record()
+    filtered_records = [record for record in records if record.get('typeId') != 16]
+
+    values, paces = formatting.format_records(
+        [record.get('value', 0) for record in filtered_records],
+        [record.get('typeId', 0) for record in filtered_records]
+    )
+    for record, formatted in zip(filtered_records, zip(values, paces)):
+        activity_date = record.get('prStartTimeGmtFormatted')
+        activity_type = format_activity_type(record.get('activityType'))
+        typeId = record.get('typeId', 0)
+        sync_record(client, database_id, activity_date, activity_type, typeId, record.get('value', 0), formatted)
+
+def run(args):
     garmin_email = os.getenv("GARMIN_EMAIL")
     garmin_password = os.getenv("GARMIN_PASSWORD")
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_PR_DB_ID")
 
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
+    client = transport.notion_client(notion_token)
 
-    client = Client(auth=notion_token)
+    if args.derive:
+        sync_derived_records(client, database_id)
+        return
 
-    records = garmin.get_personal_record()
-    filtered_records = [record for record in records if record.get('typeId') != 16]
+    garmin = transport.garmin_client(garmin_email, garmin_password)
+    garmin.login()
 
-    for record in filtered_records:
-        activity_date = record.get('prStartTimeGmtFormatted')
-        activity_type = format_activity_type(record.get('activityType'))
-        activity_name = replace_activity_name_by_typeId(record.get('typeId'))
-        typeId = record.get('typeId', 0)
-        value, pace = format_garmin_value(record.get('value', 0), activity_type, typeId)
-
-        existing_pr_record = get_existing_record(client, database_id, activity_name)
-        existing_date_record = get_record_by_date_and_name(client, database_id, activity_date, activity_name)
-
-        if existing_date_record:
-            update_record(client, existing_date_record['id'], activity_date, value, pace, activity_name, True)
-            print(f"Updated existing record: {activity_type} - {activity_name}")
-        elif existing_pr_record:
-            # Add error handling here
-            try:
-                date_prop = existing_pr_record['properties']['Date']
-                if date_prop and date_prop.get('date') and date_prop['date'].get('start'):
-                    existing_date = date_prop['date']['start']
-                    
-                    if activity_date > existing_date:
-                        update_record(client, existing_pr_record['id'], existing_date, None, None, activity_name, False)
-                        print(f"Archived old record: {activity_type} - {activity_name}")
-                        
-                        write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
-                        print(f"Created new PR record: {activity_type} - {activity_name}")
-                    else:
-                        print(f"No update needed: {activity_type} - {activity_name}")
-                else:
-                    # Handle case where date is missing or improperly formatted
-                    print(f"Warning: Record {activity_name} has invalid date format - updating anyway")
-                    update_record(client, existing_pr_record['id'], activity_date, value, pace, activity_name, True)
-            except (KeyError, TypeError) as e:
-                print(f"Error processing record {activity_name}: {e}")
-                print(f"Record data: {existing_pr_record['properties']}")
-                # Fallback - create new record if we can't process the existing one properly
-                write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
-        else:
-            write_new_record(client, database_id, activity_date, activity_type, activity_name, typeId, value, pace)
-            print(f"Successfully written new record: {activity_type} - {activity_name}")
+    sync_garmin_records(client, database_id, garmin)
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Sync personal records to Notion")
+    parser.add_argument("--derive", action="store_true", default=os.getenv("PR_SOURCE") == "local",
+                        help="derive records from the locally synced history instead of Garmin (PR_SOURCE=local)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    with tracing.session("personal-records", args.profile, args.cprofile):
+        run(args)
 
 if __name__ == '__main__':
     main()
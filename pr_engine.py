@@ -0,0 +1,264 @@
+from datetime import date, timedelta
+
+import local_store
+
+# Personal records derived from the local store (see local_store.py) instead of
+# garmin.get_personal_record(), which only returns the current best per typeId.
+# typeIds and units match Garmin's so the results feed the same Notion writers:
+# seconds for best efforts, meters for longest distances, steps for step counts.
+
+# typeId -> distance (m) for best efforts on runs. Without per-split data, the
+# effort is estimated from the activity's average pace over any run at least
+# that long, which is what the locally stored summary values allow.
+BEST_EFFORTS = {1: 1000, 2: 1609.344, 3: 5000, 4: 10000, 5: 21097.5, 6: 42195}
+LONGEST_DISTANCE = {7: "Running", 8: "Cycling"}
+STEP_RECORDS = {12: "day", 13: "week", 14: "month"}
+
+def init_schema(store):
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS pr_best (
+            type_id INTEGER PRIMARY KEY,
+            value REAL NOT NULL,
+            date TEXT NOT NULL
+        )
+    """)
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS pr_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type_id INTEGER NOT NULL,
+            activity_type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            value REAL NOT NULL,
+            published INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (type_id, date)
+        )
+    """)
+    # Published entries a rebuild dropped from the timeline: their Notion pages
+    # must be archived (see reconcile_published)
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS pr_retracted (
+            type_id INTEGER NOT NULL,
+            activity_type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (type_id, date)
+        )
+    """)
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS pr_progress (
+            source TEXT PRIMARY KEY,
+            watermark REAL NOT NULL,
+            last_date TEXT NOT NULL
+        )
+    """)
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS pr_step_days (
+            date TEXT PRIMARY KEY,
+            steps INTEGER NOT NULL
+        )
+    """)
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS pr_step_periods (
+            period TEXT PRIMARY KEY,
+            total INTEGER NOT NULL
+        )
+    """)
+
+def week_start(day):
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+def month_start(day):
+    return day[:8] + "01"
+
+class RecordEngine:
+    """
+    Running maxima (minima for times) per typeId. Each new activity or day of
+    steps is checked against the current best in O(1); every improvement is
+    appended to the PR timeline.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.best = {
+            type_id: (value, day)
+            for type_id, value, day in store.execute("SELECT type_id, value, date FROM pr_best")
+        }
+        # (type_id, date) -> (activity_type, value); a record improved twice on
+        # the same date (or period) only keeps its final value
+        self.events = {}
+
+    def check(self, type_id, activity_type, day, value, lower_is_better=False):
+        current = self.best.get(type_id)
+        if current is not None:
+            if lower_is_better and value >= current[0]:
+                return
+            if not lower_is_better and value <= current[0]:
+                return
+        self.best[type_id] = (value, day)
+        self.events[(type_id, day)] = (activity_type, value)
+
+    def add_activity(self, day, activity_type, distance_km, duration_min):
+        if not distance_km or not duration_min:
+            return
+        distance_m = distance_km * 1000
+        duration_s = duration_min * 60
+        for type_id, activity in LONGEST_DISTANCE.items():
+            if activity_type == activity:
+                self.check(type_id, activity_type, day, distance_m)
+        if activity_type == "Running":
+            for type_id, effort_m in BEST_EFFORTS.items():
+                if distance_m >= effort_m:
+                    self.check(type_id, activity_type, day, round(duration_s * effort_m / distance_m), lower_is_better=True)
+
+    def add_steps(self, day, steps):
+        """
+        Day record directly; week/month records from running period totals,
+        adjusted by the difference when a day is synced again.
+        """
+        if steps is None:
+            return
+        row = self.store.execute("SELECT steps FROM pr_step_days WHERE date = ?", (day,)).fetchone()
+        delta = steps - (row[0] if row else 0)
+        self.store.execute("INSERT OR REPLACE INTO pr_step_days (date, steps) VALUES (?, ?)", (day, steps))
+        self.check(12, "Walking", day, steps)
+        for type_id, period in ((13, week_start(day)), (14, month_start(day))):
+            key = f"{type_id}:{period}"
+            row = self.store.execute("SELECT total FROM pr_step_periods WHERE period = ?", (key,)).fetchone()
+            total = (row[0] if row else 0) + delta
+            self.store.execute("INSERT OR REPLACE INTO pr_step_periods (period, total) VALUES (?, ?)", (key, total))
+            current = self.best.get(type_id)
+            if current is not None and current[1] == period and total > current[0]:
+                # The record period itself grew: update it instead of adding a new PR
+                self.best[type_id] = (total, period)
+                self.events[(type_id, period)] = ("Walking", total)
+            else:
+                self.check(type_id, "Walking", period, total)
+
+    def save(self):
+        self.store.executemany(
+            "INSERT OR REPLACE INTO pr_best (type_id, value, date) VALUES (?, ?, ?)",
+            [(type_id, value, day) for type_id, (value, day) in self.best.items()]
+        )
+        cur = self.store.executemany(
+            """
+            INSERT INTO pr_events (type_id, activity_type, date, value) VALUES (?, ?, ?, ?)
+            ON CONFLICT (type_id, date) DO UPDATE SET
+                value = excluded.value, activity_type = excluded.activity_type, published = 0
+            WHERE pr_events.value IS NOT excluded.value
+            """,
+            [(type_id, activity_type, day, value) for (type_id, day), (activity_type, value) in self.events.items()]
+        )
+        self.events = {}
+        return max(cur.rowcount, 0)
+
+def load_new_rows(store, table, columns, source):
+    row = store.execute("SELECT watermark, last_date FROM pr_progress WHERE source = ?", (source,)).fetchone()
+    watermark, last_date = row if row else (None, "")
+    data = local_store.load_columns(store, table, columns + ("updated_at",), since=watermark)
+    rows = sorted(zip(*(data[column] for column in columns + ("updated_at",))), key=lambda r: r[0] or "")
+    return [r for r in rows if r[0]], last_date
+
+def save_progress(store, source, rows, last_date):
+    if not rows:
+        return
+    watermark = max(r[-1] for r in rows)
+    last_date = max(last_date, rows[-1][0])
+    store.execute(
+        "INSERT OR REPLACE INTO pr_progress (source, watermark, last_date) VALUES (?, ?, ?)",
+        (source, watermark, last_date)
+    )
+
+def reset(store):
+    for table in ("pr_best", "pr_progress", "pr_step_days", "pr_step_periods"):
+        store.execute(f"DELETE FROM {table}")
+    # The timeline is regenerated by the rebuild; published entries are kept
+    # aside until reconcile_published compares them with the new one
+    store.execute("""
+        INSERT OR REPLACE INTO pr_retracted (type_id, activity_type, date, value)
+        SELECT type_id, activity_type, date, value FROM pr_events WHERE published = 1
+    """)
+    store.execute("DELETE FROM pr_events")
+
+def reconcile_published(store):
+    """
+    After a rebuild: entries still in the timeline with the same value stay
+    published; entries whose date is still a record are updated in place when
+    republished; the others remain in pr_retracted. For every record with a
+    retracted entry, the rebuilt best is republished so it gets the PR flag back.
+    """
+    store.execute("""
+        UPDATE pr_events SET published = 1 WHERE EXISTS (
+            SELECT 1 FROM pr_retracted r
+            WHERE r.type_id = pr_events.type_id AND r.date = pr_events.date AND r.value = pr_events.value
+        )
+    """)
+    store.execute("""
+        DELETE FROM pr_retracted WHERE EXISTS (
+            SELECT 1 FROM pr_events e WHERE e.type_id = pr_retracted.type_id AND e.date = pr_retracted.date
+        )
+    """)
+    store.execute("""
+        UPDATE pr_events SET published = 0
+        WHERE type_id IN (SELECT type_id FROM pr_retracted)
+          AND (type_id, date) IN (SELECT type_id, date FROM pr_best)
+    """)
+
+def update_records(store):
+    """
+    Feed rows added or changed since the last call to the engine.
+    Rows arriving in date order are processed incrementally. If older history
+    was backfilled (a row dated before the last processed one), the maxima are
+    rebuilt from the whole store so the timeline stays chronological.
+    Returns the number of new or changed PR timeline entries.
+    """
+    init_schema(store)
+    local_store.init_schema(store)
+    activities, last_activity = load_new_rows(
+        store, "activities", ("date", "activity_type", "distance_km", "duration_min"), "activities")
+    steps, last_steps = load_new_rows(store, "daily_steps", ("date", "total_steps"), "daily_steps")
+
+    backfilled = (activities and activities[0][0] < last_activity) or (steps and steps[0][0] < last_steps)
+    if backfilled:
+        print("Older history was synced, rebuilding personal records")
+        reset(store)
+        count = update_records(store)
+        reconcile_published(store)
+        return count
+
+    engine = RecordEngine(store)
+    for day, activity_type, distance_km, duration_min, _ in activities:
+        engine.add_activity(day.replace(" ", "T"), activity_type, distance_km, duration_min)
+    for day, total_steps, _ in steps:
+        engine.add_steps(day, total_steps)
+    count = engine.save()
+    save_progress(store, "activities", activities, last_activity)
+    save_progress(store, "daily_steps", steps, last_steps)
+    return count
+
+def unpublished_events(store):
+    """
+    PR timeline entries not yet written to Notion, oldest first:
+    [(event_id, type_id, activity_type, date, value), ...].
+    """
+    return store.execute(
+        "SELECT event_id, type_id, activity_type, date, value FROM pr_events WHERE published = 0 ORDER BY date, event_id"
+    ).fetchall()
+
+def retracted_events(store):
+    """
+    Published entries dropped by a rebuild: [(type_id, activity_type, date, value), ...].
+    """
+    return store.execute("SELECT type_id, activity_type, date, value FROM pr_retracted ORDER BY date").fetchall()
+
+def forget_retracted(store, type_id, day):
+    store.execute("DELETE FROM pr_retracted WHERE type_id = ? AND date = ?", (type_id, day))
+
+def current_best(store):
+    """
+    {type_id: date} of the current record of each type.
+    """
+    return dict(store.execute("SELECT type_id, date FROM pr_best").fetchall())
+
+def mark_published(store, event_id):
+    store.execute("UPDATE pr_events SET published = 1 WHERE event_id = ?", (event_id,))
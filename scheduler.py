@@ -0,0 +1,100 @@
+import json
+import os
+import time
+
+import sync_state
+import tracing
+
+# Time-budgeted work queue. Pending work of every data type is ranked by
+# priority then recency, run while the budget allows, and whatever is left
+# is saved for the next run.
+
+QUEUE_FILE = "queue.json"
+# Stop starting new work this many seconds before the budget runs out
+BUDGET_MARGIN = float(os.getenv("SYNC_BUDGET_MARGIN", "60"))
+MAX_ATTEMPTS = 3
+# Cost estimate (seconds) for a kind of work never seen before
+DEFAULT_COST = 5.0
+
+def item_id(item):
+    return f"{item['kind']}:{item['key']}"
+
+class Scheduler:
+    def __init__(self, budget_seconds, margin=BUDGET_MARGIN):
+        self.deadline = time.monotonic() + budget_seconds
+        self.margin = margin
+        self.path = sync_state.state_path(QUEUE_FILE)
+        self.handlers = {}
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.items = {item_id(item): item for item in state.get("items", [])}
+        # Moving average of the duration of each kind of work
+        self.costs = state.get("costs", {})
+
+    def register(self, kind, handler):
+        """
+        handler(item) does the work; an exception leaves the item queued for a retry.
+        """
+        self.handlers[kind] = handler
+
+    def add(self, kind, key, day, priority, payload=None):
+        """
+        Queue work (lower priority runs first, then newest `day` first). Work
+        already queued keeps its attempts and gets the newer payload.
+        """
+        item = {"kind": kind, "key": str(key), "date": day or "", "priority": priority, "payload": payload, "attempts": 0}
+        previous = self.items.get(item_id(item))
+        if previous:
+            item["attempts"] = previous["attempts"]
+            item["priority"] = min(priority, previous["priority"])
+        self.items[item_id(item)] = item
+
+    def ranked(self):
+        items = sorted(self.items.values(), key=lambda item: item["date"], reverse=True)
+        return sorted(items, key=lambda item: item["priority"])
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def run(self):
+        done = 0
+        for n, item in enumerate(self.ranked(), 1):
+            handler = self.handlers.get(item["kind"])
+            if handler is None:
+                continue
+            estimate = self.costs.get(item["kind"], DEFAULT_COST)
+            if self.remaining() < estimate + self.margin:
+                print(f"Time budget nearly spent ({self.remaining():.0f}s left), stopping")
+                break
+            start = time.monotonic()
+            try:
+                with tracing.span(item["kind"], key=str(item["key"])):
+                    handler(item)
+                del self.items[item_id(item)]
+                done += 1
+            except Exception as e:
+                item["attempts"] += 1
+                print(f"Error running {item_id(item)} (attempt {item['attempts']}): {e}")
+                if item["attempts"] >= MAX_ATTEMPTS:
+                    print(f"Giving up on {item_id(item)}")
+                    del self.items[item_id(item)]
+            elapsed = time.monotonic() - start
+            self.costs[item["kind"]] = 0.7 * self.costs.get(item["kind"], elapsed) + 0.3 * elapsed
+            if n % 20 == 0:
+                self.save()
+        self.save()
+
+        left = {}
+        for item in self.items.values():
+            left[item["kind"]] = left.get(item["kind"], 0) + 1
+        summary = ", ".join(f"{count} {kind}" for kind, count in sorted(left.items()))
+        print(f"Ran {done} item(s); left for next run: {summary or 'nothing'}")
+        return done
+
+    def save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"items": list(self.items.values()), "costs": self.costs}, f)
+        os.replace(self.path + ".tmp", self.path)
@@ -1,40 +1,44 @@
-from datetime import datetime, timedelta
-from garminconnect import Garmin
-from notion_client import Client
+from datetime import datetime
 from dotenv import load_dotenv, dotenv_values
+import argparse
 import pytz
 import os
 
+import formatting
+import local_store
+import sync_state
+import tracing
+import transport
+import wellness
+
 # Constants
 local_tz = pytz.timezone("Europe/Paris")
-DAYS_TO_SYNC = 14  # 🔥 deux dernières semaines
+DAYS_TO_SYNC = wellness.SLEEP_DAYS_TO_SYNC  # 🔥 deux dernières semaines (SLEEP_DAYS_TO_SYNC)
 
 # Load environment variables
 load_dotenv()
 CONFIG = dotenv_values()
 
-def get_sleep_data(garmin, date_str):
-    try:
-        return garmin.get_sleep_data(date_str)
-    except Exception as e:
-        print(f"Error fetching sleep data for {date_str}: {e}")
-        return None
-
-def format_duration(seconds):
-    minutes = (seconds or 0) // 60
-    return f"{minutes // 60}h {minutes % 60}m"
-
-def format_time(timestamp):
-    return (
-        datetime.utcfromtimestamp(timestamp / 1000).strftime("%Y-%m-%dT%H:%M:%S.000Z")
-        if timestamp else None
-    )
-
-def format_time_readable(timestamp):
-    return (
-        datetime.fromtimestamp(timestamp / 1000, local_tz).strftime("%H:%M")
-        if timestamp else "Unknown"
-    )
+def get_sleep_data(fetcher, date_str):
+    """
+    Sleep payload of a day from the shared wellness fetcher (None on error).
+    """
+    return fetcher.day(date_str, ["sleep"]).get("sleep")
+
+def sleep_times(daily_sleeps):
+    """
+    Formatted bed/wake times of many nights in one batch:
+    [{"start": ISO UTC, "end": ISO UTC, "times": "HH:MM → HH:MM"}, ...].
+    """
+    timestamps = []
+    for daily_sleep in daily_sleeps:
+        timestamps += [daily_sleep.get('sleepStartTimestampGMT'), daily_sleep.get('sleepEndTimestampGMT')]
+    iso = formatting.utc_iso(timestamps)
+    clock = formatting.local_clock(timestamps, local_tz)
+    return [
+        {"start": iso[i], "end": iso[i + 1], "times": f"{clock[i]} → {clock[i + 1]}"}
+        for i in range(0, len(timestamps), 2)
+    ]
 
 def format_date_for_name(sleep_date):
     return datetime.strptime(sleep_date, "%Y-%m-%d").strftime("%d.%m.%Y") if sleep_date else "Unknown"
@@ -51,12 +55,40 @@ def sleep_data_exists(client, database_id, sleep_date):
         print(f"Error checking existence for {sleep_date}: {e}")
         return None
 
-def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
+def sleep_values(sleep_data, times=None):
+    """
+    Normalized sleep values, as written to Notion (and to the local store).
+    """
+    daily_sleep = sleep_data.get('dailySleepDTO', {})
+    times = times or sleep_times([daily_sleep])[0]
+
+    # Convert None to 0
+    light_sleep_sec = daily_sleep.get('lightSleepSeconds') or 0
+    deep_sleep_sec = daily_sleep.get('deepSleepSeconds') or 0
+    rem_sleep_sec = daily_sleep.get('remSleepSeconds') or 0
+    awake_sleep_sec = daily_sleep.get('awakeSleepSeconds') or 0
+    total_sleep = light_sleep_sec + deep_sleep_sec + rem_sleep_sec
+
+    return {
+        "date": daily_sleep.get('calendarDate'),
+        "sleep_start": times["start"],
+        "sleep_end": times["end"],
+        "total_sleep_h": round(total_sleep / 3600, 1),
+        "light_sleep_h": round(light_sleep_sec / 3600, 1),
+        "deep_sleep_h": round(deep_sleep_sec / 3600, 1),
+        "rem_sleep_h": round(rem_sleep_sec / 3600, 1),
+        "awake_h": round(awake_sleep_sec / 3600, 1),
+        "resting_hr": sleep_data.get('restingHeartRate') or 0,
+    }
+
+def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True, times=None):
     daily_sleep = sleep_data.get('dailySleepDTO', {})
     if not daily_sleep:
         return
     
     sleep_date = daily_sleep.get('calendarDate', "Unknown Date")
+    times = times or sleep_times([daily_sleep])[0]
+    values = sleep_values(sleep_data, times)
 
     # Convert None to 0
     light_sleep_sec = daily_sleep.get('lightSleepSeconds') or 0
@@ -69,22 +101,23 @@ def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
         print(f"Skipping sleep data for {sleep_date} as total sleep is 0")
         return
 
+    durations = formatting.hours_minutes([total_sleep, light_sleep_sec, deep_sleep_sec, rem_sleep_sec, awake_sleep_sec])
     properties = {
         "Date": {"title": [{"text": {"content": format_date_for_name(sleep_date)}}]},
-        "Times": {"rich_text": [{"text": {"content": f"{format_time_readable(daily_sleep.get('sleepStartTimestampGMT'))} → {format_time_readable(daily_sleep.get('sleepEndTimestampGMT'))}"}}]},
+        "Times": {"rich_text": [{"text": {"content": times["times"]}}]},
         "Long Date": {"date": {"start": sleep_date}},
-        "Full Date/Time": {"date": {"start": format_time(daily_sleep.get('sleepStartTimestampGMT')), "end": format_time(daily_sleep.get('sleepEndTimestampGMT'))}},
-        "Total Sleep (h)": {"number": round(total_sleep / 3600, 1)},
-        "Light Sleep (h)": {"number": round(light_sleep_sec / 3600, 1)},
-        "Deep Sleep (h)": {"number": round(deep_sleep_sec / 3600, 1)},
-        "REM Sleep (h)": {"number": round(rem_sleep_sec / 3600, 1)},
-        "Awake Time (h)": {"number": round(awake_sleep_sec / 3600, 1)},
-        "Total Sleep": {"rich_text": [{"text": {"content": format_duration(total_sleep)}}]},
-        "Light Sleep": {"rich_text": [{"text": {"content": format_duration(light_sleep_sec)}}]},
-        "Deep Sleep": {"rich_text": [{"text": {"content": format_duration(deep_sleep_sec)}}]},
-        "REM Sleep": {"rich_text": [{"text": {"content": format_duration(rem_sleep_sec)}}]},
-        "Awake Time": {"rich_text": [{"text": {"content": format_duration(awake_sleep_sec)}}]},
-        "Resting HR": {"number": sleep_data.get('restingHeartRate') or 0}
+        "Full Date/Time": {"date": {"start": values["sleep_start"], "end": values["sleep_end"]}},
+        "Total Sleep (h)": {"number": values["total_sleep_h"]},
+        "Light Sleep (h)": {"number": values["light_sleep_h"]},
+        "Deep Sleep (h)": {"number": values["deep_sleep_h"]},
+        "REM Sleep (h)": {"number": values["rem_sleep_h"]},
+        "Awake Time (h)": {"number": values["awake_h"]},
+        "Total Sleep": {"rich_text": [{"text": {"content": durations[0]}}]},
+        "Light Sleep": {"rich_text": [{"text": {"content": durations[1]}}]},
+        "Deep Sleep": {"rich_text": [{"text": {"content": durations[2]}}]},
+        "REM Sleep": {"rich_text": [{"text": {"content": durations[3]}}]},
+        "Awake Time": {"rich_text": [{"text": {"content": durations[4]}}]},
+        "Resting HR": {"number": values["resting_hr"]}
     }
     
     try:
@@ -93,37 +126,64 @@ def create_sleep_data(client, database_id, sleep_data, skip_zero_sleep=True):
     except Exception as e:
         print(f"Error creating sleep entry for {sleep_date}: {e}")
 
-def main():
-    load_dotenv()
-
+@tracing.traced("sync_sleep_day")
+def sync_sleep_day(client, database_id, store, fetcher, day, times=None):
+    """
+    Store one night of sleep locally and create its Notion entry if missing.
+    `times` are the night's sleep_times() when formatted in a batch.
+    """
+    data = get_sleep_data(fetcher, day)
+    if data:
+        sleep_date = data.get('dailySleepDTO', {}).get('calendarDate')
+        if sleep_date:
+            times = times or sleep_times([data['dailySleepDTO']])[0]
+            local_store.save_sleep(store, sleep_values(data, times))
+            if not sleep_data_exists(client, database_id, sleep_date):
+                create_sleep_data(client, database_id, data, skip_zero_sleep=False, times=times)
+            else:
+                print(f"Sleep data already exists for {sleep_date}")
+    else:
+        print(f"No sleep data for {day}")
+
+def run(args):
     # Initialize Garmin and Notion clients using environment variables
     garmin_email = os.getenv("GARMIN_EMAIL")
     garmin_password = os.getenv("GARMIN_PASSWORD")
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_SLEEP_DB_ID")
 
-    garmin = Garmin(garmin_email, garmin_password)
-    try:
+    def login():
+        garmin = transport.garmin_client(garmin_email, garmin_password)
         garmin.login()
         print("Garmin login successful")
+        return garmin
+
+    # Garmin is only logged in if the wellness cache misses some days
+    fetcher = wellness.WellnessFetcher(login)
+    try:
+        fetcher.prefetch(wellness.sync_plan(fetcher.today, wellness.enabled_metrics()))
     except Exception as e:
         print("Garmin login failed:", e)
         return
 
-    client = Client(auth=notion_token)
-
-    for delta in range(DAYS_TO_SYNC):  # 🔥 seulement 14 jours
-        day = (datetime.today() - timedelta(days=delta)).date().isoformat()
-        data = get_sleep_data(garmin, day)
-        if data:
-            sleep_date = data.get('dailySleepDTO', {}).get('calendarDate')
-            if sleep_date:
-                if not sleep_data_exists(client, database_id, sleep_date):
-                    create_sleep_data(client, database_id, data, skip_zero_sleep=False)
-                else:
-                    print(f"Sleep data already exists for {sleep_date}")
-        else:
-            print(f"No sleep data for {day}")
+    client = transport.notion_client(notion_token)
+
+    store = sync_state.connect()
+    local_store.init_schema(store)
+
+    # Format every night of the window at once (SLEEP_DAYS_TO_SYNC can span years of backfill)
+    days = wellness.sleep_window(fetcher.today)  # 🔥 seulement 14 jours
+    nights = [(get_sleep_data(fetcher, day) or {}).get('dailySleepDTO') or {} for day in days]
+    for day, times in zip(days, sleep_times(nights)):
+        sync_sleep_day(client, database_id, store, fetcher, day, times)
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Sync sleep data to Notion")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    with tracing.session("sleep-data", args.profile, args.cprofile):
+        run(args)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,115 @@
+from datetime import date
+from dotenv import load_dotenv
+import argparse
+import importlib.util
+import os
+
+import local_store
+import scheduler
+import sync_journal
+import sync_state
+import tracing
+import transport
+import wellness
+
+# Priorities: fresh data (today's activities, last night's sleep, yesterday's
+# steps) first, then the once-per-run derived data, then the last week, and
+# historical backfill last.
+PRIORITY_FRESH = 0
+PRIORITY_DAILY = 1
+PRIORITY_RECENT = 2
+PRIORITY_BACKFILL = 3
+
+def load_script(filename):
+    """
+    Import one of the sync scripts (their file names are not valid module names).
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(filename[:-3].replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def priority_for(day, today):
+    age = (today - date.fromisoformat(day[:10])).days
+    if age <= 1:
+        return PRIORITY_FRESH
+    if age <= 7:
+        return PRIORITY_RECENT
+    return PRIORITY_BACKFILL
+
+def run(args):
+    activities_db = os.getenv("NOTION_DB_ID")
+    pr_db = os.getenv("NOTION_PR_DB_ID")
+    steps_db = os.getenv("NOTION_STEPS_DB_ID")
+    sleep_db = os.getenv("NOTION_SLEEP_DB_ID")
+    summary_db = os.getenv("NOTION_SUMMARY_DB_ID")
+
+    activities = load_script("garmin-activities.py")
+    records = load_script("personal-records.py")
+    steps = load_script("daily-steps.py")
+    sleep = load_script("sleep-data.py")
+    summaries = load_script("training-summaries.py")
+
+    garmin = transport.garmin_client(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
+    garmin.login()
+    client = transport.notion_client(os.getenv("NOTION_TOKEN"))
+    store = sync_state.connect()
+    sync_journal.init_schema(store)
+    local_store.init_schema(store)
+    fetcher = wellness.WellnessFetcher(lambda: garmin)
+    today = fetcher.today
+
+    queue = scheduler.Scheduler(args.budget_seconds)
+
+    # Discovery: queue everything that may need syncing
+    with tracing.span("discovery"):
+        activities.recover_journal(client, activities_db, store)
+        if sync_journal.is_empty(store):
+            queue.add("dedupe", "activities", today.isoformat(), PRIORITY_DAILY)
+        for activity in activities.get_all_activities(garmin):
+            local_store.save_activity(store, activities.activity_values(activity))
+            entry = sync_journal.lookup(store, activity.get('activityId'))
+            if entry and entry[0] == "done" and entry[2] == activities.activity_fingerprint(activity):
+                continue
+            day = activity.get('startTimeGMT', '')
+            queue.add("activity", activity.get('activityId'), day, priority_for(day, today), activity)
+        if steps_db:
+            for day in wellness.steps_window(today):
+                queue.add("steps", day, day, priority_for(day, today))
+        if sleep_db:
+            for day in wellness.sleep_window(today):
+                queue.add("sleep", day, day, priority_for(day, today))
+        if pr_db:
+            queue.add("records", "all", today.isoformat(), PRIORITY_DAILY)
+        if summary_db:
+            queue.add("summaries", "all", today.isoformat(), PRIORITY_DAILY)
+
+    queue.register("dedupe", lambda item: activities.remove_duplicates(client, activities_db))
+    queue.register("activity", lambda item: activities.sync_garmin_activity(client, activities_db, store, item["payload"]))
+    def sync_steps_day(item):
+        for day_steps in fetcher.day(item["key"], ["steps"]).get("steps") or []:
+            steps.sync_daily_steps(client, steps_db, store, day_steps)
+
+    queue.register("steps", sync_steps_day)
+    queue.register("sleep", lambda item: sleep.sync_sleep_day(client, sleep_db, store, fetcher, item["key"]))
+    if os.getenv("PR_SOURCE") == "local":
+        queue.register("records", lambda item: records.sync_derived_records(client, pr_db))
+    else:
+        queue.register("records", lambda item: records.sync_garmin_records(client, pr_db, garmin))
+    queue.register("summaries", lambda item: summaries.sync_summaries(client, summary_db, store))
+
+    queue.run()
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run every Garmin to Notion sync within a time budget")
+    parser.add_argument("--budget-seconds", type=float, default=float(os.getenv("SYNC_BUDGET_SECONDS", "1500")),
+                        help="wall-clock budget for this run (SYNC_BUDGET_SECONDS)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    with tracing.session("sync-all", args.profile, args.cprofile):
+        run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import json
+import time
+
+# Write-ahead journal of Notion writes, keyed by Garmin activityId.
+# An entry is written as 'pending' before the Notion call and marked 'done'
+# (with the page id) once it succeeded, so a crash in between is detected
+# and resolved on the next run instead of producing a duplicate page.
+
+def init_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS journal (
+            activity_id INTEGER PRIMARY KEY,
+            op TEXT NOT NULL,
+            status TEXT NOT NULL,
+            page_id TEXT,
+            fingerprint TEXT,
+            payload TEXT,
+            updated_at REAL NOT NULL
+        )
+    """)
+
+def begin(conn, activity_id, op, payload, page_id=None):
+    """
+    Record the intent to create/update an activity before calling Notion.
+    """
+    conn.execute(
+        """
+        INSERT INTO journal (activity_id, op, status, page_id, payload, updated_at)
+        VALUES (?, ?, 'pending', ?, ?, ?)
+        ON CONFLICT (activity_id) DO UPDATE SET
+            op = excluded.op, status = 'pending',
+            page_id = COALESCE(excluded.page_id, journal.page_id),
+            payload = excluded.payload, updated_at = excluded.updated_at
+        """,
+        (activity_id, op, page_id, json.dumps(payload), time.time())
+    )
+
+def commit(conn, activity_id, page_id, fingerprint):
+    """
+    Mark the entry done once Notion confirmed the write (or the page was found).
+    The payload is dropped, only the page id and fingerprint are kept.
+    """
+    conn.execute(
+        """
+        INSERT INTO journal (activity_id, op, status, page_id, fingerprint, updated_at)
+        VALUES (?, 'sync', 'done', ?, ?, ?)
+        ON CONFLICT (activity_id) DO UPDATE SET
+            status = 'done', page_id = excluded.page_id, fingerprint = excluded.fingerprint,
+            payload = NULL, updated_at = excluded.updated_at
+        """,
+        (activity_id, page_id, fingerprint, time.time())
+    )
+
+def forget(conn, activity_id):
+    conn.execute("DELETE FROM journal WHERE activity_id = ?", (activity_id,))
+
+def lookup(conn, activity_id):
+    """
+    Returns (status, page_id, fingerprint) or None.
+    """
+    return conn.execute(
+        "SELECT status, page_id, fingerprint FROM journal WHERE activity_id = ?", (activity_id,)
+    ).fetchone()
+
+def pending(conn):
+    """
+    Entries left pending by an interrupted run: [(activity_id, op, page_id, payload), ...].
+    """
+    return [
+        (activity_id, op, page_id, json.loads(payload))
+        for activity_id, op, page_id, payload in conn.execute(
+            "SELECT activity_id, op, page_id, payload FROM journal WHERE status = 'pending' ORDER BY updated_at"
+        )
+    ]
+
+def is_empty(conn):
+    return conn.execute("SELECT 1 FROM journal LIMIT 1").fetchone() is None
@@ -0,0 +1,135 @@
+from datetime import date, timedelta
+import os
+import time
+
+# A worker that stops renewing its lease for this long loses the shard.
+LEASE_SECONDS = int(os.getenv("SYNC_LEASE_SECONDS", "900"))
+
+def init_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shards (
+            run_id TEXT NOT NULL,
+            shard_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            lease_expires REAL,
+            created INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            archived INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            PRIMARY KEY (run_id, shard_id)
+        )
+    """)
+
+def month_shards(since, until):
+    """
+    Split [since, until] into calendar-month shards, newest first.
+    Returns a list of (shard_id, start_date, end_date).
+    """
+    shards = []
+    start = since
+    while start <= until:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        end = min(next_month - timedelta(days=1), until)
+        shards.append((f"{start.isoformat()}..{end.isoformat()}", start, end))
+        start = next_month
+    shards.reverse()
+    return shards
+
+def register_shards(conn, run_id, shards):
+    """
+    Insert the shards of a run. When a run is resumed, finished shards are kept
+    and failed ones are queued again.
+    """
+    init_schema(conn)
+    conn.executemany(
+        "INSERT OR IGNORE INTO shards (run_id, shard_id, position, start_date, end_date) VALUES (?, ?, ?, ?, ?)",
+        [(run_id, shard_id, position, start.isoformat(), end.isoformat())
+         for position, (shard_id, start, end) in enumerate(shards)]
+    )
+    conn.execute("UPDATE shards SET status = 'pending' WHERE run_id = ? AND status = 'failed'", (run_id,))
+
+def claim_shard(conn, run_id, owner, shard_index=0, shard_count=1, lease_seconds=LEASE_SECONDS):
+    """
+    Atomically lease the next pending (or expired) shard of the run.
+    With shard_count > 1 only shards whose position % shard_count == shard_index
+    are eligible, so separate CI jobs never overlap even without shared state.
+    Returns (shard_id, start_date, end_date) or None when nothing is left.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            """
+            SELECT shard_id, start_date, end_date FROM shards
+            WHERE run_id = ? AND position % ? = ?
+              AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+            ORDER BY position LIMIT 1
+            """,
+            (run_id, shard_count, shard_index, now)
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE shards SET status = 'leased', owner = ?, lease_expires = ?, error = NULL WHERE run_id = ? AND shard_id = ?",
+                (owner, now + lease_seconds, run_id, row[0])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if not row:
+        return None
+    return row[0], date.fromisoformat(row[1]), date.fromisoformat(row[2])
+
+def renew_lease(conn, run_id, shard_id, owner, lease_seconds=LEASE_SECONDS):
+    """
+    Extend our lease. Returns False if the shard was taken over by another worker.
+    """
+    cur = conn.execute(
+        "UPDATE shards SET lease_expires = ? WHERE run_id = ? AND shard_id = ? AND owner = ? AND status = 'leased'",
+        (time.time() + lease_seconds, run_id, shard_id, owner)
+    )
+    return cur.rowcount == 1
+
+def complete_shard(conn, run_id, shard_id, owner, created=0, updated=0, skipped=0, archived=0):
+    conn.execute(
+        """
+        UPDATE shards SET status = 'done', lease_expires = NULL,
+            created = ?, updated = ?, skipped = ?, archived = ?
+        WHERE run_id = ? AND shard_id = ? AND owner = ?
+        """,
+        (created, updated, skipped, archived, run_id, shard_id, owner)
+    )
+
+def fail_shard(conn, run_id, shard_id, owner, error):
+    """
+    Release the shard; it is retried when the run is resumed.
+    """
+    conn.execute(
+        "UPDATE shards SET status = 'failed', owner = NULL, lease_expires = NULL, error = ? WHERE run_id = ? AND shard_id = ? AND owner = ?",
+        (str(error), run_id, shard_id, owner)
+    )
+
+def run_totals(conn, run_id):
+    """
+    Merge step: aggregate counters and shard statuses of a run.
+    """
+    init_schema(conn)
+    totals = dict(zip(
+        ("created", "updated", "skipped", "archived"),
+        conn.execute(
+            "SELECT COALESCE(SUM(created), 0), COALESCE(SUM(updated), 0), COALESCE(SUM(skipped), 0), COALESCE(SUM(archived), 0) FROM shards WHERE run_id = ?",
+            (run_id,)
+        ).fetchone()
+    ))
+    totals["shards"] = dict(conn.execute(
+        "SELECT status, COUNT(*) FROM shards WHERE run_id = ? GROUP BY status", (run_id,)
+    ).fetchall())
+    totals["errors"] = conn.execute(
+        "SELECT shard_id, error FROM shards WHERE run_id = ? AND error IS NOT NULL", (run_id,)
+    ).fetchall()
+    return totals
@@ -0,0 +1,25 @@
+import os
+import sqlite3
+
+# Local state shared by the sync scripts (leases, journal, caches...).
+# In GitHub Actions this directory is restored/saved with actions/cache.
+STATE_DIR = os.getenv("SYNC_STATE_DIR", ".sync-state")
+STATE_DB = "sync.db"
+
+def state_path(*parts):
+    """
+    Return a path inside the state directory, creating the directory if needed.
+    """
+    path = os.path.join(STATE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def connect(name=STATE_DB):
+    """
+    Open the SQLite state database in autocommit mode. WAL + busy timeout let
+    several worker processes share it safely.
+    """
+    conn = sqlite3.connect(state_path(name), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
@@ -0,0 +1,110 @@
+import importlib.util
+import itertools
+import os
+
+import pytest
+
+import local_store
+import pr_engine
+import sync_state
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeNotion:
+    """
+    Just enough of the Notion PR database for personal-records.py.
+    """
+
+    def __init__(self):
+        self.pages = self
+        self.databases = self
+        self.store = {}
+        self.ids = itertools.count(1)
+
+    def query(self, database_id, filter):
+        def matches(page, condition):
+            prop = page["properties"][condition["property"]]
+            if "title" in condition:
+                return prop["title"][0]["text"]["content"] == condition["title"]["equals"]
+            if "checkbox" in condition:
+                return prop["checkbox"] == condition["checkbox"]["equals"]
+            return prop["date"]["start"] == condition["date"]["equals"]
+
+        results = [
+            page for page in self.store.values()
+            if not page["archived"] and all(matches(page, c) for c in filter["and"])
+        ]
+        return {"results": results}
+
+    def create(self, parent, properties, **kwargs):
+        page_id = str(next(self.ids))
+        self.store[page_id] = {"id": page_id, "archived": False, "properties": dict(properties)}
+        return self.store[page_id]
+
+    def update(self, page_id, properties=None, archived=None, **kwargs):
+        page = self.store[page_id]
+        page["properties"].update(properties or {})
+        if archived is not None:
+            page["archived"] = archived
+
+    def live(self, name):
+        """
+        {date: PR flag} of the non-archived pages of a record.
+        """
+        return {
+            page["properties"]["Date"]["date"]["start"]: page["properties"]["PR"]["checkbox"]
+            for page in self.store.values()
+            if not page["archived"] and page["properties"]["Record"]["title"][0]["text"]["content"] == name
+        }
+
+@pytest.fixture
+def records(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_state, "STATE_DIR", str(tmp_path))
+    spec = importlib.util.spec_from_file_location("personal_records", os.path.join(ROOT, "personal-records.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def save_run(store, activity_id, day, distance_km):
+    local_store.save_activity(store, {
+        "activity_id": activity_id, "date": f"{day}T08:00:00", "activity_type": "Running",
+        "distance_km": distance_km, "duration_min": distance_km * 3,
+    })
+
+def test_backfill_replaces_published_records(records):
+    store = sync_state.connect()
+    local_store.init_schema(store)
+    notion = FakeNotion()
+
+    # Incremental: two successive longest runs, both published
+    save_run(store, 1, "2024-05-01", 20)
+    records.sync_derived_records(notion, "db")
+    save_run(store, 2, "2024-06-01", 25)
+    records.sync_derived_records(notion, "db")
+    assert notion.live("Longest Run") == {"2024-05-01T08:00:00": False, "2024-06-01T08:00:00": True}
+
+    # Backfill of an older, longer run: it is the only record left
+    save_run(store, 3, "2023-01-01", 30)
+    records.sync_derived_records(notion, "db")
+    assert notion.live("Longest Run") == {"2023-01-01T08:00:00": True}
+    assert store.execute("SELECT date, value, published FROM pr_events WHERE type_id = 7").fetchall() == [
+        ("2023-01-01T08:00:00", 30000.0, 1)
+    ]
+    assert pr_engine.retracted_events(store) == []
+
+def test_backfill_keeps_records_that_still_hold(records):
+    store = sync_state.connect()
+    local_store.init_schema(store)
+    notion = FakeNotion()
+
+    save_run(store, 1, "2024-05-01", 20)
+    save_run(store, 2, "2024-06-01", 25)
+    records.sync_derived_records(notion, "db")
+
+    # An older, shorter run adds a first entry and keeps the later ones
+    save_run(store, 3, "2023-01-01", 10)
+    records.sync_derived_records(notion, "db")
+    assert notion.live("Longest Run") == {
+        "2023-01-01T08:00:00": False, "2024-05-01T08:00:00": False, "2024-06-01T08:00:00": True,
+    }
+    assert pr_engine.unpublished_events(store) == []
@@ -0,0 +1,172 @@
+from contextlib import contextmanager, nullcontext
+import cProfile
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+import sync_state
+
+# Lightweight spans around sync phases and external calls, written as a
+# Chrome trace (open in chrome://tracing or https://ui.perfetto.dev).
+# Tracing is off unless --profile is given or the run is picked by
+# TRACE_SAMPLE_RATE (0..1); when off, a span costs one attribute check.
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+NOTION_CALLS = {
+    "databases": ("query",),
+    "pages": ("create", "update", "retrieve"),
+}
+GARMIN_CALLS = (
+    "login", "get_activities", "get_activities_by_date", "get_personal_record",
+    "get_daily_steps", "get_sleep_data", "get_stress_data", "get_body_battery",
+)
+
+_NOOP = nullcontext()
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.origin = time.perf_counter()
+        self.path = None
+        self.pid = None
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, args)
+
+    def reset(self):
+        self.events = []
+
+    def write(self, path, process_name):
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": process_name}}]
+        events += [dict(event, pid=pid) for event in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self, top=10):
+        """
+        Total time per span name, slowest first.
+        """
+        totals = {}
+        for event in self.events:
+            total, count = totals.get(event["name"], (0, 0))
+            totals[event["name"]] = (total + event["dur"], count + 1)
+        return sorted(totals.items(), key=lambda item: -item[1][0])[:top]
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.events.append({
+            "name": self.name, "ph": "X",
+            "ts": (self.start - self.tracer.origin) * 1e6, "dur": (end - self.start) * 1e6,
+            "tid": threading.get_ident(), "args": self.args,
+        })
+        return False
+
+TRACER = Tracer()
+
+def span(name, **args):
+    return TRACER.span(name, **args)
+
+def traced(name):
+    """
+    Decorator: run the function inside a span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with _Span(TRACER, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument_notion(client):
+    """
+    Span every Notion call made through this client.
+    """
+    for endpoint_name, methods in NOTION_CALLS.items():
+        endpoint = getattr(client, endpoint_name)
+        for method in methods:
+            setattr(endpoint, method, traced(f"notion.{endpoint_name}.{method}")(getattr(endpoint, method)))
+    return client
+
+def instrument_garmin(garmin):
+    for method in GARMIN_CALLS:
+        if hasattr(garmin, method):
+            setattr(garmin, method, traced(f"garmin.{method}")(getattr(garmin, method)))
+    return garmin
+
+def add_arguments(parser):
+    parser.add_argument("--profile", metavar="TRACE.json",
+                        help="write a Chrome trace of this run (TRACE_SAMPLE_RATE traces a share of runs)")
+    parser.add_argument("--cprofile", metavar="PROFILE.prof", help="also dump cProfile stats for this run")
+
+@contextmanager
+def session(name, profile=None, cprofile=None):
+    """
+    Enable tracing for the run if asked (or sampled), then write the trace,
+    the optional cProfile dump and a per-phase summary when it ends.
+    """
+    if profile is None and SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        profile = sync_state.state_path("traces", f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    TRACER.enabled = profile is not None
+    TRACER.path = profile
+    TRACER.pid = os.getpid()
+    TRACER.reset()
+    profiler = cProfile.Profile() if cprofile else None
+    if profiler:
+        profiler.enable()
+    try:
+        with span(name):
+            yield TRACER
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(cprofile)
+            print(f"cProfile stats written to {cprofile}")
+        if TRACER.enabled:
+            TRACER.write(profile, name)
+            print(f"Trace written to {profile}")
+            for span_name, (total, count) in TRACER.summary():
+                print(f"  {span_name:<40} {total / 1000:10.1f} ms  x{count}")
+        TRACER.enabled = False
+
+@contextmanager
+def child_session(name):
+    """
+    In a forked worker: drop the events inherited from the parent and write
+    this worker's spans next to the parent trace (<trace>.<name>.json).
+    In the parent process this is a plain span.
+    """
+    if not TRACER.enabled or os.getpid() == TRACER.pid:
+        with span(name):
+            yield TRACER
+        return
+    TRACER.reset()
+    try:
+        with span(name):
+            yield TRACER
+    finally:
+        base, ext = os.path.splitext(TRACER.path)
+        TRACER.write(f"{base}.{name}{ext}", name)
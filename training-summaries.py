@@ -0,0 +1,225 @@
+from datetime import date, timedelta
+from dotenv import load_dotenv
+import argparse
+import hashlib
+import json
+import numpy as np
+import os
+
+import local_store
+import sync_state
+import tracing
+import transport
+
+PERIODS = ("Week", "Month")
+
+def period_starts(dates, period):
+    """
+    Vectorized: ISO dates ('YYYY-MM-DD...') -> first day of their week (Monday)
+    or month, as int64 day numbers since 1970-01-01.
+    """
+    days = np.array([d[:10] for d in dates], dtype='datetime64[D]')
+    if period == "Week":
+        day_numbers = days.astype(np.int64)
+        # 1970-01-01 was a Thursday: (n + 3) % 7 is 0 on Mondays
+        return day_numbers - (day_numbers + 3) % 7
+    return days.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+def group_by_period(keys, columns):
+    """
+    Sum each column per period key. NaN (missing values) count as 0 in sums;
+    `<column>_n` holds the number of non-missing values for averages.
+    Returns {period_key: {column: total, ...}}.
+    """
+    if len(keys) == 0:
+        return {}
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    totals = {}
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=float)
+        present = ~np.isnan(values)
+        totals[name] = np.bincount(inverse, weights=np.where(present, values, 0.0), minlength=len(uniq))
+        totals[f"{name}_n"] = np.bincount(inverse, weights=present, minlength=len(uniq))
+    return {
+        int(key): {name: float(column[i]) for name, column in totals.items()}
+        for i, key in enumerate(uniq)
+    }
+
+@tracing.traced("compute_summaries")
+def compute_summaries(store):
+    """
+    Weekly and monthly summaries of the locally stored activities, steps and sleep.
+    Returns {(period, start_day_number): {metric: value}}.
+    """
+    activities = local_store.load_columns(store, "activities", (
+        "date", "distance_km", "duration_min", "calories", "aerobic", "anaerobic"))
+    steps = local_store.load_columns(store, "daily_steps", ("date", "total_steps", "step_goal"))
+    sleep = local_store.load_columns(store, "sleep", ("date", "total_sleep_h", "resting_hr"))
+
+    total_steps = np.array(steps["total_steps"], dtype=float)
+    step_goal = np.array(steps["step_goal"], dtype=float)
+    goal_met = (total_steps >= step_goal).astype(float)  # NaN compares False
+    resting_hr = np.array(sleep["resting_hr"], dtype=float)
+    resting_hr[resting_hr == 0] = np.nan  # 0 means "not measured"
+
+    summaries = {}
+    for period in PERIODS:
+        sources = (
+            (activities["date"], {
+                "activities": np.ones(len(activities["date"])),
+                "distance_km": activities["distance_km"],
+                "duration_min": activities["duration_min"],
+                "calories": activities["calories"],
+                "aerobic": activities["aerobic"],
+                "anaerobic": activities["anaerobic"],
+            }),
+            (steps["date"], {"total_steps": total_steps, "step_goal": step_goal, "goal_met": goal_met}),
+            (sleep["date"], {"total_sleep_h": sleep["total_sleep_h"], "resting_hr": resting_hr}),
+        )
+        for dates, columns in sources:
+            for key, totals in group_by_period(period_starts(dates, period), columns).items():
+                summaries.setdefault((period, key), {}).update(totals)
+
+    return {key: summary_metrics(totals) for key, totals in summaries.items()}
+
+def summary_metrics(totals):
+    def average(name, digits):
+        count = totals.get(f"{name}_n", 0)
+        return round(totals[name] / count, digits) if count else None
+
+    return {
+        "activities": int(totals.get("activities", 0)),
+        "distance_km": round(totals.get("distance_km", 0), 2),
+        "duration_min": round(totals.get("duration_min", 0), 1),
+        "calories": round(totals.get("calories", 0)),
+        "aerobic": round(totals.get("aerobic", 0), 1),
+        "anaerobic": round(totals.get("anaerobic", 0), 1),
+        "total_steps": int(totals.get("total_steps", 0)),
+        "step_goal": int(totals.get("step_goal", 0)),
+        "goal_days": int(totals.get("goal_met", 0)),
+        "step_days": int(totals.get("total_steps_n", 0)),
+        "avg_sleep_h": average("total_sleep_h", 1) if "total_sleep_h" in totals else None,
+        "avg_resting_hr": average("resting_hr", 0) if "resting_hr" in totals else None,
+    }
+
+def period_bounds(period, start_day):
+    start = date(1970, 1, 1) + timedelta(days=start_day)
+    if period == "Week":
+        return start, start + timedelta(days=6)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+def period_title(period, start):
+    if period == "Week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    return start.strftime("%Y-%m")
+
+def summary_properties(period, start_day, metrics):
+    start, end = period_bounds(period, start_day)
+    properties = {
+        "Period": {"title": [{"text": {"content": period_title(period, start)}}]},
+        "Type": {"select": {"name": period}},
+        "Date": {"date": {"start": start.isoformat(), "end": end.isoformat()}},
+        "Activities": {"number": metrics["activities"]},
+        "Distance (km)": {"number": metrics["distance_km"]},
+        "Duration (min)": {"number": metrics["duration_min"]},
+        "Calories": {"number": metrics["calories"]},
+        "Aerobic Load": {"number": metrics["aerobic"]},
+        "Anaerobic Load": {"number": metrics["anaerobic"]},
+        "Total Steps": {"number": metrics["total_steps"]},
+        "Step Goal": {"number": metrics["step_goal"]},
+        "Goal Days": {"number": metrics["goal_days"]},
+        "Step Days": {"number": metrics["step_days"]},
+        "Avg Sleep (h)": {"number": metrics["avg_sleep_h"]},
+        "Avg Resting HR": {"number": metrics["avg_resting_hr"]},
+    }
+    return properties
+
+def init_schema(store):
+    store.execute("""
+        CREATE TABLE IF NOT EXISTS summary_pages (
+            summary_id TEXT PRIMARY KEY,
+            page_id TEXT NOT NULL,
+            fingerprint TEXT NOT NULL
+        )
+    """)
+
+def summary_exists(client, database_id, title, period):
+    """
+    Fallback when the local state was lost: find the summary page by its title.
+    """
+    query = client.databases.query(
+        database_id=database_id,
+        filter={
+            "and": [
+                {"property": "Period", "title": {"equals": title}},
+                {"property": "Type", "select": {"equals": period}}
+            ]
+        }
+    )
+    results = query['results']
+    return results[0]['id'] if results else None
+
+@tracing.traced("write_summaries")
+def write_summaries(client, database_id, store, summaries):
+    """
+    Create or update only the summary pages whose metrics changed since the last run.
+    """
+    known = dict((row[0], (row[1], row[2])) for row in store.execute(
+        "SELECT summary_id, page_id, fingerprint FROM summary_pages"))
+    written = 0
+    for (period, start_day), metrics in sorted(summaries.items()):
+        properties = summary_properties(period, start_day, metrics)
+        title = properties["Period"]["title"][0]["text"]["content"]
+        summary_id = f"{period}:{title}"
+        fingerprint = hashlib.sha1(json.dumps(metrics, sort_keys=True).encode()).hexdigest()
+
+        page_id, previous = known.get(summary_id, (None, None))
+        if previous == fingerprint:
+            continue
+        page_id = page_id or summary_exists(client, database_id, title, period)
+        try:
+            if page_id:
+                client.pages.update(page_id=page_id, properties=properties)
+                print(f"Updated summary: {summary_id}")
+            else:
+                page_id = client.pages.create(
+                    parent={"database_id": database_id}, properties=properties, icon={"emoji": "📈"}
+                )['id']
+                print(f"Created summary: {summary_id}")
+        except Exception as e:
+            print(f"Error writing summary {summary_id}: {e}")
+            continue
+        store.execute(
+            "INSERT OR REPLACE INTO summary_pages (summary_id, page_id, fingerprint) VALUES (?, ?, ?)",
+            (summary_id, page_id, fingerprint)
+        )
+        written += 1
+    print(f"{written} summary page(s) written, {len(summaries) - written} unchanged")
+
+def sync_summaries(client, database_id, store):
+    local_store.init_schema(store)
+    init_schema(store)
+    write_summaries(client, database_id, store, compute_summaries(store))
+
+def run(args):
+    notion_token = os.getenv("NOTION_TOKEN")
+    database_id = os.getenv("NOTION_SUMMARY_DB_ID")
+    if not database_id:
+        print("NOTION_SUMMARY_DB_ID not set, skipping summaries")
+        return
+
+    client = transport.notion_client(notion_token)
+    sync_summaries(client, database_id, sync_state.connect())
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Write weekly and monthly summaries to Notion")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    with tracing.session("training-summaries", args.profile, args.cprofile):
+        run(args)
+
+if __name__ == '__main__':
+    main()
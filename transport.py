@@ -0,0 +1,74 @@
+from garminconnect import Garmin
+from notion_client import Client
+import httpx
+import os
+
+import tracing
+
+# Shared HTTP settings for the Notion and Garmin clients, so every script
+# reuses pooled keep-alive connections instead of paying connection setup
+# on each sequential databases.query / pages.create.
+NOTION_TIMEOUT = float(os.getenv("NOTION_TIMEOUT", "60"))
+NOTION_CONNECT_TIMEOUT = float(os.getenv("NOTION_CONNECT_TIMEOUT", "10"))
+NOTION_HTTP2 = os.getenv("NOTION_HTTP2", "1") == "1"
+GARMIN_TIMEOUT = int(os.getenv("GARMIN_TIMEOUT", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+def http2_available():
+    try:
+        import h2  # noqa: F401  (httpx[http2] extra)
+    except ImportError:
+        return False
+    return True
+
+def accept_encoding():
+    """
+    Content codings httpx can decode in this environment.
+    """
+    encodings = ["gzip", "deflate"]
+    try:
+        import brotli  # noqa: F401
+        encodings.append("br")
+    except ImportError:
+        pass
+    return ", ".join(encodings)
+
+def make_http_client(http2=None):
+    if http2 is None:
+        http2 = NOTION_HTTP2
+    return httpx.Client(
+        http2=http2 and http2_available(),
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+def notion_client(auth, http2=None, **options):
+    """
+    notion_client.Client on a pooled keep-alive httpx client with compression
+    and separate connect/read timeouts. Extra options (e.g. base_url) are passed
+    to notion_client.
+    """
+    http = make_http_client(http2)
+    client = Client(auth=auth, client=http, timeout_ms=int(NOTION_TIMEOUT * 1000), **options)
+    # notion_client sets a single overall timeout on the httpx client it is given:
+    # fail fast on connect, keep the long timeout for slow queries
+    http.timeout = httpx.Timeout(NOTION_TIMEOUT, connect=NOTION_CONNECT_TIMEOUT)
+    http.headers["Accept-Encoding"] = accept_encoding()
+    return tracing.instrument_notion(client)
+
+def configure_garmin(garmin):
+    """
+    Size the connection pool of Garmin's requests session and set its timeout.
+    """
+    try:
+        garmin.garth.configure(timeout=GARMIN_TIMEOUT, pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    except TypeError:  # older garth without pool options
+        garmin.garth.configure(timeout=GARMIN_TIMEOUT)
+    return garmin
+
+def garmin_client(email, password):
+    return tracing.instrument_garmin(configure_garmin(Garmin(email, password)))
@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+import json
+import os
+import time
+
+import sync_state
+
+# Day-level Garmin wellness data shared by daily-steps.py and sleep-data.py.
+# Each (day, metric) is requested once over the union of the sync windows,
+# kept in memory for the process and on disk (one JSON file per day) for the
+# other scripts of the same run. Adding a daily metric only means adding a
+# fetcher to METRICS.
+
+STEPS_DAYS_TO_SYNC = int(os.getenv("STEPS_DAYS_TO_SYNC", "1"))  # yesterday, today excluded
+SLEEP_DAYS_TO_SYNC = int(os.getenv("SLEEP_DAYS_TO_SYNC", "14"))  # today and the 13 days before
+# Optional metrics fetched for every synced day, e.g. "stress,body_battery"
+EXTRA_METRICS = tuple(m for m in os.getenv("WELLNESS_EXTRA", "").split(",") if m)
+# Data of the last FINAL_AFTER_DAYS days may still change on Garmin's side:
+# it is refetched once older than CACHE_TTL seconds. Older days are final once
+# they hold data; empty days (watch not synced yet) keep being refetched.
+FINAL_AFTER_DAYS = 2
+CACHE_TTL = int(os.getenv("WELLNESS_CACHE_TTL", "3600"))
+
+METRICS = {
+    "steps": lambda garmin, day: garmin.get_daily_steps(day, day),
+    "sleep": lambda garmin, day: garmin.get_sleep_data(day),
+    "stress": lambda garmin, day: garmin.get_stress_data(day),
+    "body_battery": lambda garmin, day: garmin.get_body_battery(day),
+}
+
+def has_data(metric, payload):
+    """
+    False for the empty payloads Garmin returns before the watch has synced.
+    """
+    if not payload:
+        return False
+    if metric == "sleep":
+        daily_sleep = payload.get("dailySleepDTO") or {}
+        return bool(daily_sleep.get("sleepStartTimestampGMT") or daily_sleep.get("sleepTimeSeconds"))
+    if metric == "steps":
+        return any(day.get("totalSteps") for day in payload)
+    return True
+
+def steps_window(today=None):
+    today = today or date.today()
+    return [(today - timedelta(days=delta)).isoformat() for delta in range(STEPS_DAYS_TO_SYNC, 0, -1)]
+
+def sleep_window(today=None):
+    """
+    Newest first, like the original sleep sync loop.
+    """
+    today = today or date.today()
+    return [(today - timedelta(days=delta)).isoformat() for delta in range(SLEEP_DAYS_TO_SYNC)]
+
+def enabled_metrics():
+    """
+    Metrics whose Notion database is configured, as sync-all.py queues them.
+    """
+    databases = {"steps": "NOTION_STEPS_DB_ID", "sleep": "NOTION_SLEEP_DB_ID"}
+    return tuple(metric for metric, env in databases.items() if os.getenv(env))
+
+def sync_plan(today=None, metrics=("steps", "sleep")):
+    """
+    {day: set of metrics} over the union of the windows of `metrics`.
+    """
+    plan = {}
+    if "steps" in metrics:
+        for day in steps_window(today):
+            plan.setdefault(day, set()).add("steps")
+    if "sleep" in metrics:
+        for day in sleep_window(today):
+            plan.setdefault(day, set()).add("sleep")
+    for metrics in plan.values():
+        metrics.update(EXTRA_METRICS)
+    return plan
+
+class WellnessFetcher:
+    """
+    Fetches day-level metrics with a two-level cache. Garmin is only logged in
+    (through `login`, a callable returning a Garmin client) on the first miss,
+    so a script whose data is already cached makes no Garmin call at all.
+    """
+
+    def __init__(self, login, today=None):
+        self.login = login
+        self.garmin = None
+        self.today = today or date.today()
+        self.memory = {}
+
+    def cache_path(self, day):
+        return sync_state.state_path("wellness", f"{day}.json")
+
+    def is_fresh(self, day, fetched_at, metric, payload):
+        if date.fromisoformat(day) < self.today - timedelta(days=FINAL_AFTER_DAYS) and has_data(metric, payload):
+            return True
+        return time.time() - fetched_at < CACHE_TTL
+
+    def load(self, day):
+        if day in self.memory:
+            return self.memory[day]
+        try:
+            with open(self.cache_path(day)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {"date": day, "fetched_at": {}}
+        self.memory[day] = data
+        return data
+
+    def save(self, day, data):
+        path = self.cache_path(day)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def day(self, day, metrics=("steps", "sleep")):
+        """
+        Day data {"date", <metric>: payload, ...}; only stale or missing metrics are requested.
+        """
+        data = self.load(day)
+        fetched = False
+        for metric in metrics:
+            fetched_at = data["fetched_at"].get(metric)
+            if fetched_at is not None and self.is_fresh(day, fetched_at, metric, data.get(metric)):
+                continue
+            if self.garmin is None:
+                self.garmin = self.login()
+            try:
+                data[metric] = METRICS[metric](self.garmin, day)
+            except Exception as e:
+                # Not cached: retried on the next call
+                print(f"Error fetching {metric} for {day}: {e}")
+                data.setdefault(metric, None)
+                continue
+            data["fetched_at"][metric] = time.time()
+            fetched = True
+        if fetched:
+            self.save(day, data)
+        return data
+
+    def prefetch(self, plan):
+        for day, metrics in sorted(plan.items(), reverse=True):
+            self.day(day, sorted(metrics))